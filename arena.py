@@ -0,0 +1,492 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains the BoardArena class, an alternative storage engine for a
+Blocky board that keeps every node of the tree in flat typed arrays, and the
+ArenaBlock class, a light view that lets an arena be used anywhere a Block is
+expected.
+"""
+from __future__ import annotations
+from typing import Optional, Tuple, List
+from array import array
+import random
+import math
+
+from block import Block, _majority
+from settings import colour_index, index_colour, COLOUR_LIST, NO_COLOUR
+
+# The child index stored for a node that has no children.
+NO_CHILD = -1
+
+
+def generate_arena_board(max_depth: int, size: int) -> ArenaBlock:
+    """Return a new game board with a depth of <max_depth> and dimensions of
+    <size> by <size>, stored in a BoardArena.
+
+    This is the arena equivalent of block.generate_board, and consumes the
+    random number generator in the same order.
+
+    >>> board = generate_arena_board(3, 750)
+    >>> board.max_depth
+    3
+    >>> len(board.children) == 4
+    True
+    """
+    arena = BoardArena(size, max_depth, random.choice(COLOUR_LIST))
+    board = arena.root()
+    board.smash()
+
+    return board
+
+
+class BoardArena:
+    """A Blocky board stored as a quad-tree in flat typed arrays.
+
+    Every node of the tree is identified by an integer id, and node 0 is the
+    root. Children are always allocated in groups of four, so a smash costs a
+    single allocation and a combine returns the group to a free list.
+
+    Nothing about a node's position is stored: positions are determined by the
+    path from the root, and are computed by ArenaBlock views as they are
+    created.
+
+    === Public Attributes ===
+    size:
+        The height and width of the whole board.
+    max_depth:
+        The deepest level allowed in the board.
+    """
+    # === Private Attributes ===
+    # _colours:
+    #   The index into settings.PALETTE of each node's colour, or NO_COLOUR if
+    #   the node has children.
+    # _levels:
+    #   The level of each node.
+    # _children:
+    #   Four entries per node: the ids of the node's children in the same
+    #   order as Block.children, or NO_CHILD if the node is a leaf.
+    # _free:
+    #   The first ids of groups of four nodes that were released by a combine
+    #   and can be reused by a smash.
+    #
+    # === Representation Invariants ===
+    # - len(_colours) == len(_levels) == len(_children) // 4
+    # - For every node, either all four child entries are NO_CHILD or none are.
+    size: int
+    max_depth: int
+    _colours: array
+    _levels: array
+    _children: array
+    _free: List[int]
+
+    def __init__(self, size: int, max_depth: int,
+                 colour: Optional[Tuple[int, int, int]] = None) -> None:
+        """Initialize this arena with a single root node of the given <colour>,
+        dimensions <size> by <size>, and a depth of <max_depth>.
+
+        Preconditions:
+            - size > 0
+            - 0 <= max_depth < 256
+        """
+        self.size = size
+        self.max_depth = max_depth
+        self._colours = array('h', [colour_index(colour)])
+        self._levels = array('B', [0])
+        self._children = array('i', [NO_CHILD] * 4)
+        self._free = []
+
+    @staticmethod
+    def from_block(block: Block) -> BoardArena:
+        """Return a new arena holding a copy of the tree rooted at <block>.
+
+        <block> becomes the root of the arena, so its level must be 0.
+        """
+        arena = BoardArena(block.size, block.max_depth, block.colour)
+        arena._copy_children(0, block)
+        return arena
+
+    def _copy_children(self, node: int, block: Block) -> None:
+        """Copy the descendants of <block> into the arena below <node>.
+        """
+        if block.children:
+            first = self._allocate(block.level + 1)
+            for i in range(4):
+                child = block.children[i]
+                self._children[node * 4 + i] = first + i
+                self._colours[first + i] = child.colour_index
+                self._copy_children(first + i, child)
+
+    def root(self) -> ArenaBlock:
+        """Return a Block compatible view of the root of this arena.
+        """
+        return ArenaBlock(self, 0, (0, 0), self.size)
+
+    def to_block(self) -> Block:
+        """Return a new Block tree equivalent to the board in this arena.
+        """
+        return self._to_block(0, (0, 0), self.size)
+
+    def _to_block(self, node: int, position: Tuple[int, int],
+                  size: int) -> Block:
+        """Return a new Block for the subtree rooted at <node>, at <position>
+        with dimensions <size> by <size>.
+        """
+        block = Block(position, size, self.colour(node), self._levels[node],
+                      self.max_depth)
+        if self.is_leaf(node):
+            return block
+        positions = block._children_positions()
+        child_size = block._child_size()
+        block.children = [self._to_block(self._children[node * 4 + i],
+                                         positions[i], child_size)
+                          for i in range(4)]
+        return block
+
+    def copy(self) -> BoardArena:
+        """Return a deep copy of this arena.
+
+        Each of the typed arrays is copied as a single buffer, so no per-node
+        objects are created.
+        """
+        other = BoardArena.__new__(BoardArena)
+        other.size = self.size
+        other.max_depth = self.max_depth
+        other._colours = self._colours[:]
+        other._levels = self._levels[:]
+        other._children = self._children[:]
+        other._free = self._free[:]
+        return other
+
+    def __len__(self) -> int:
+        """Return the number of node slots in this arena, including the ones on
+        the free list.
+        """
+        return len(self._levels)
+
+    def nbytes(self) -> int:
+        """Return the number of bytes used by the node arrays of this arena.
+        """
+        return len(self._colours) * self._colours.itemsize + \
+            len(self._levels) * self._levels.itemsize + \
+            len(self._children) * self._children.itemsize
+
+    def colour(self, node: int) -> Optional[Tuple[int, int, int]]:
+        """Return the colour of <node>, or None if it has children.
+        """
+        return index_colour(self._colours[node])
+
+    def colour_index(self, node: int) -> int:
+        """Return the palette index of the colour of <node>, or NO_COLOUR if it
+        has children.
+        """
+        return self._colours[node]
+
+    def set_colour(self, node: int,
+                   colour: Optional[Tuple[int, int, int]]) -> None:
+        """Set the colour of <node> to <colour>.
+        """
+        self._colours[node] = colour_index(colour)
+
+    def level(self, node: int) -> int:
+        """Return the level of <node>.
+        """
+        return self._levels[node]
+
+    def is_leaf(self, node: int) -> bool:
+        """Return True iff <node> has no children.
+        """
+        return self._children[node * 4] == NO_CHILD
+
+    def child(self, node: int, i: int) -> int:
+        """Return the id of child <i> of <node>.
+
+        Precondition: <node> is not a leaf and 0 <= i < 4.
+        """
+        return self._children[node * 4 + i]
+
+    def _allocate(self, level: int) -> int:
+        """Return the first id of a group of four new leaf nodes at <level>.
+        """
+        if self._free:
+            first = self._free.pop()
+            for i in range(first, first + 4):
+                self._levels[i] = level
+                self._colours[i] = NO_COLOUR
+                for j in range(4):
+                    self._children[i * 4 + j] = NO_CHILD
+            return first
+        first = len(self._levels)
+        self._colours.extend([NO_COLOUR] * 4)
+        self._levels.extend([level] * 4)
+        self._children.extend([NO_CHILD] * 16)
+        return first
+
+    def smash(self, node: int) -> bool:
+        """Sub-divide <node> into four randomly generated children, as
+        described in Block.smash.
+
+        Return True iff the smash was performed.
+        """
+        level = self._levels[node]
+        if level == self.max_depth or not self.is_leaf(node):
+            return False
+        first = self._allocate(level + 1)
+        for i in range(4):
+            self._children[node * 4 + i] = first + i
+        self._colours[node] = NO_COLOUR
+
+        for i in range(4):
+            ran = random.random()
+            if ran < math.exp(-0.25 * level):
+                if not self.smash(first + i):
+                    self.set_colour(first + i, random.choice(COLOUR_LIST))
+            else:
+                self.set_colour(first + i, random.choice(COLOUR_LIST))
+        return True
+
+    def swap(self, node: int, direction: int) -> bool:
+        """Swap the children of <node>, as described in Block.swap.
+
+        Return True iff the swap was performed.
+        """
+        if self.is_leaf(node):
+            return False
+        c = self._children
+        base = node * 4
+        if direction == 1:
+            c[base], c[base + 3] = c[base + 3], c[base]
+            c[base + 1], c[base + 2] = c[base + 2], c[base + 1]
+        else:
+            c[base], c[base + 1] = c[base + 1], c[base]
+            c[base + 3], c[base + 2] = c[base + 2], c[base + 3]
+        return True
+
+    def rotate(self, node: int, direction: int) -> bool:
+        """Rotate <node> and all its descendants, as described in Block.rotate.
+
+        Return True iff the rotate was performed.
+        """
+        if self.is_leaf(node):
+            return False
+        c = self._children
+        base = node * 4
+        if direction == 1:
+            c[base], c[base + 1], c[base + 2], c[base + 3] = \
+                c[base + 1], c[base + 2], c[base + 3], c[base]
+        else:
+            c[base], c[base + 1], c[base + 2], c[base + 3] = \
+                c[base + 3], c[base], c[base + 1], c[base + 2]
+        for i in range(4):
+            self.rotate(c[base + i], direction)
+        return True
+
+    def paint(self, node: int, colour: Tuple[int, int, int]) -> bool:
+        """Change the colour of <node>, as described in Block.paint.
+
+        Return True iff the colour was changed.
+        """
+        index = colour_index(colour)
+        if self._levels[node] == self.max_depth and self.is_leaf(node) and \
+                self._colours[node] != index:
+            self._colours[node] = index
+            return True
+        return False
+
+    def combine(self, node: int) -> bool:
+        """Turn <node> into a leaf based on the majority colour of its
+        children, as described in Block.combine.
+
+        Return True iff <node> was turned into a leaf.
+        """
+        if self._levels[node] != self.max_depth - 1 or self.is_leaf(node):
+            return False
+        winner = _majority([self._colours[self._children[node * 4 + i]]
+                            for i in range(4)])
+        if winner is None:
+            return False
+        self._free.append(min(self._children[node * 4:node * 4 + 4]))
+        self._colours[node] = winner
+        for i in range(4):
+            self._children[node * 4 + i] = NO_CHILD
+        return True
+
+
+class ArenaBlock:
+    """A view of one node of a BoardArena that behaves like a Block.
+
+    Views are cheap to create and hold no state of their own apart from where
+    the node is drawn, so they can be thrown away at any time. Two views of the
+    same node always see the same data.
+
+    === Public Attributes ===
+    position:
+        The (x, y) coordinates of the upper left corner of this Block.
+    size:
+        The height and width of this square Block.
+    arena:
+        The arena that stores this block.
+    node:
+        The id of this block within <arena>.
+    """
+    position: Tuple[int, int]
+    size: int
+    arena: BoardArena
+    node: int
+
+    def __init__(self, arena: BoardArena, node: int,
+                 position: Tuple[int, int], size: int) -> None:
+        """Initialize this view of <node> in <arena>, drawn at <position> with
+        dimensions <size> by <size>.
+        """
+        self.arena = arena
+        self.node = node
+        self.position = position
+        self.size = size
+
+    @property
+    def colour(self) -> Optional[Tuple[int, int, int]]:
+        """The colour of this block, or None if it has children."""
+        return self.arena.colour(self.node)
+
+    @colour.setter
+    def colour(self, colour: Optional[Tuple[int, int, int]]) -> None:
+        self.arena.set_colour(self.node, colour)
+
+    @property
+    def colour_index(self) -> int:
+        """The palette index of this block's colour, or NO_COLOUR."""
+        return self.arena.colour_index(self.node)
+
+    @property
+    def level(self) -> int:
+        """The level of this block within the board."""
+        return self.arena.level(self.node)
+
+    @property
+    def max_depth(self) -> int:
+        """The deepest level allowed in the board."""
+        return self.arena.max_depth
+
+    @property
+    def children(self) -> List[ArenaBlock]:
+        """Views of the children of this block, in the same order as
+        Block.children. Changing the returned list has no effect on the board.
+        """
+        if self.arena.is_leaf(self.node):
+            return []
+        positions = self._children_positions()
+        size = self._child_size()
+        return [ArenaBlock(self.arena, self.arena.child(self.node, i),
+                           positions[i], size) for i in range(4)]
+
+    def __eq__(self, other: Block) -> bool:
+        """Return True iff this Block and all its descendents are equivalent to
+        the <other> Block and all its descendents. <other> may be an
+        ArenaBlock or a Block.
+        """
+        children = self.children
+        other_children = other.children
+        if len(children) == 0 and len(other_children) == 0:
+            return self.position == other.position and \
+                   self.size == other.size and \
+                   self.colour_index == other.colour_index and \
+                   self.level == other.level and \
+                   self.max_depth == other.max_depth
+        elif len(children) != len(other_children):
+            return False
+        else:
+            for i in range(4):
+                if children[i] != other_children[i]:
+                    return False
+            return True
+
+    def _child_size(self) -> int:
+        """Return the size of this Block's children.
+        """
+        return round(self.size / 2.0)
+
+    def _children_positions(self) -> List[Tuple[int, int]]:
+        """Return the positions of this Block's four children, in the same
+        order as Block._children_positions.
+        """
+        x = self.position[0]
+        y = self.position[1]
+        size = self._child_size()
+
+        return [(x + size, y), (x, y), (x, y + size), (x + size, y + size)]
+
+    def smashable(self) -> bool:
+        """Return True iff this block can be smashed.
+        """
+        return self.level != self.max_depth and self.arena.is_leaf(self.node)
+
+    def smash(self) -> bool:
+        """Sub-divide this block so that it has four randomly generated
+        children. Return True iff the smash was performed.
+        """
+        return self.arena.smash(self.node)
+
+    def swap(self, direction: int) -> bool:
+        """Swap the child Blocks of this Block. Return True iff the swap was
+        performed.
+        """
+        return self.arena.swap(self.node, direction)
+
+    def rotate(self, direction: int) -> bool:
+        """Rotate this Block and all its descendants. Return True iff the
+        rotate was performed.
+        """
+        return self.arena.rotate(self.node, direction)
+
+    def paint(self, colour: Tuple[int, int, int]) -> bool:
+        """Change this Block's colour. Return True iff the colour was changed.
+        """
+        return self.arena.paint(self.node, colour)
+
+    def combine(self) -> bool:
+        """Turn this Block into a leaf based on the majority colour of its
+        children. Return True iff this Block was turned into a leaf.
+        """
+        return self.arena.combine(self.node)
+
+    def create_copy(self) -> ArenaBlock:
+        """Return a view of the same node in a deep copy of the arena.
+        """
+        return ArenaBlock(self.arena.copy(), self.node, self.position,
+                          self.size)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'random', 'typing', '__future__', 'math',
+            'array', 'block', 'settings'
+        ],
+        'max-attributes': 15,
+        'max-args': 6
+    })
+
+    b1 = generate_arena_board(3, 750)
+    b2 = b1.arena.to_block()
+    print(f'{len(b1.arena)} nodes in {b1.arena.nbytes()} bytes')
+    print(b2)
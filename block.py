@@ -22,11 +22,214 @@ Misha Schwartz, and Jaisie Sin
 This file contains the Block class, the main data structure used in the game.
 """
 from __future__ import annotations
-from typing import Optional, Tuple, List
+from typing import Dict, Optional, Tuple, List
 import random
 import math
+try:
+    import numpy
+except ImportError:  # numpy is optional, boards then have no cached grid
+    numpy = None
+
+from settings import colour_name, colour_index, index_colour, COLOUR_LIST
+
+# Hashes are unsigned 64-bit integers.
+_MASK = (1 << 64) - 1
+# An odd 64-bit multiplier for combining the hashes of a block's children.
+_MIX = 0x9E3779B97F4A7C15
+# Zobrist keys already generated, by (level, colour index) for a leaf and by
+# (level, child index) for a block with children.
+_LEAF_KEYS = {}
+_PARENT_KEYS = {}
+# How much of a block is out of date in the cached grid of its board.
+_CLEAN = 0
+_DIRTY_BELOW = 1
+_DIRTY = 2
+# The children lying along the top, right, bottom and left edges of a block.
+_EDGE_CHILDREN = ((0, 1), (0, 3), (2, 3), (1, 2))
+# The current epoch, kept in a list so that new_epoch can advance it.
+_EPOCH = [0]
+
+
+def _splitmix(x: int) -> int:
+    """Return a well mixed 64-bit integer derived from <x>.
+
+    This is the finaliser of the SplitMix64 generator. It is deterministic, so
+    hashes built from it are the same in every run of the game.
+    """
+    x = (x + 0x9E3779B97F4A7C15) & _MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK
+    return x ^ (x >> 31)
+
+
+def _leaf_key(level: int, colour: int) -> int:
+    """Return the Zobrist key of a leaf at <level> whose colour has the palette
+    index <colour>.
+    """
+    key = _LEAF_KEYS.get((level, colour))
+    if key is None:
+        key = _splitmix((level << 32) | colour | (1 << 62))
+        _LEAF_KEYS[(level, colour)] = key
+    return key
+
+
+def _parent_key(level: int, i: int) -> int:
+    """Return the Zobrist key for child <i> of a block with children at
+    <level>. Child hashes are mixed with it so that the order of the children
+    matters.
+    """
+    key = _PARENT_KEYS.get((level, i))
+    if key is None:
+        key = _splitmix((level << 8) | i | (1 << 61))
+        _PARENT_KEYS[(level, i)] = key
+    return key
+
+
+def _leaf_summary(side: int, matches: bool) -> Tuple:
+    """Return the blob summary of a leaf with <side> unit cells along each
+    edge, which is of the summarised colour iff <matches>.
+
+    A blob summary is a tuple (edges, sizes, best). <edges> holds the top,
+    right, bottom and left edges, top and bottom from left to right and left
+    and right from top to bottom. Each edge is a tuple of (length, label)
+    segments, where <label> is the blob that the cells of the segment belong
+    to, or -1 if they are of another colour. sizes[label] is the size of that
+    blob, and <best> is the size of the largest blob not touching an edge.
+    """
+    if matches:
+        edge = ((side, 0),)
+        return (edge, edge, edge, edge), (side * side,), 0
+    edge = ((side, -1),)
+    return (edge, edge, edge, edge), (), 0
 
-from settings import colour_name, COLOUR_LIST
+
+def _rotate_summary(summary: Tuple, turns: int) -> Tuple:
+    """Return <summary> as it would be after <turns> clockwise quarter turns
+    of its block.
+    """
+    edges, sizes, best = summary
+    for _ in range(turns):
+        top, right, bottom, left = edges
+        edges = (left[::-1], top, right[::-1], bottom)
+    return edges, sizes, best
+
+
+def _join_edges(parent: List[int], sizes: List[int], a: Tuple, a_offset: int,
+                b: Tuple, b_offset: int) -> None:
+    """Join the blobs on either side of the edge along which the segments <a>
+    and <b> meet, in the union-find forest <parent> over blob labels, whose
+    blob sizes are in <sizes>. The labels of <a> and <b> are shifted by
+    <a_offset> and <b_offset>.
+    """
+    i = j = 0
+    a_end, a_label = a[0]
+    b_end, b_label = b[0]
+    while True:
+        if a_label >= 0 and b_label >= 0:
+            x = _find(parent, a_label + a_offset)
+            y = _find(parent, b_label + b_offset)
+            if x != y:
+                parent[y] = x
+                sizes[x] += sizes[y]
+        if a_end == b_end:
+            i += 1
+            j += 1
+            if i == len(a):
+                return
+            a_end += a[i][0]
+            a_label = a[i][1]
+            b_end += b[j][0]
+            b_label = b[j][1]
+        elif a_end < b_end:
+            i += 1
+            a_end += a[i][0]
+            a_label = a[i][1]
+        else:
+            j += 1
+            b_end += b[j][0]
+            b_label = b[j][1]
+
+
+def _majority(indices: List[int]) -> Optional[int]:
+    """Return the palette index that occurs most often in <indices>, or None
+    if no single one does.
+    """
+    counts = {}
+    for index in indices:
+        counts[index] = counts.get(index, 0) + 1
+    high = max(counts.values())
+    winners = [index for index in counts if counts[index] == high]
+    if len(winners) != 1:
+        return None
+    return winners[0]
+
+
+def _find(parent: List[int], k: int) -> int:
+    """Return the representative of <k> in the union-find forest <parent>,
+    halving the path to it on the way.
+    """
+    while parent[k] != k:
+        parent[k] = parent[parent[k]]
+        k = parent[k]
+    return k
+
+
+def _merge_summaries(kids: List[Tuple]) -> Tuple:
+    """Return the blob summary of a block whose children, in the usual order,
+    have the blob summaries <kids>.
+    """
+    offsets = []
+    sizes = []
+    best = 0
+    for edges, kid_sizes, kid_best in kids:
+        offsets.append(len(sizes))
+        sizes.extend(kid_sizes)
+        best = max(best, kid_best)
+    parent = list(range(len(sizes)))
+    # Each edge between two children, as (child, edge, child, edge).
+    # 1  0
+    # 2  3
+    for a, a_edge, b, b_edge in ((1, 1, 0, 3), (2, 1, 3, 3), (1, 2, 2, 0),
+                                 (0, 2, 3, 0)):
+        _join_edges(parent, sizes, kids[a][0][a_edge], offsets[a],
+                    kids[b][0][b_edge], offsets[b])
+    # Relabel the blobs that reach the outer edges, and merge neighbouring
+    # segments that now belong to the same blob.
+    labels = {}
+    new_sizes = []
+    edges = []
+    for halves in (((1, 0), (0, 0)), ((0, 1), (3, 1)), ((2, 2), (3, 2)),
+                   ((1, 3), (2, 3))):
+        edge = []
+        for kid, side in halves:
+            for length, label in kids[kid][0][side]:
+                if label >= 0:
+                    root = _find(parent, label + offsets[kid])
+                    label = labels.get(root)
+                    if label is None:
+                        label = len(new_sizes)
+                        labels[root] = label
+                        new_sizes.append(sizes[root])
+                if edge and edge[-1][1] == label:
+                    edge[-1] = (edge[-1][0] + length, label)
+                else:
+                    edge.append((length, label))
+        edges.append(tuple(edge))
+    for k in range(len(parent)):
+        if parent[k] == k and k not in labels and sizes[k] > best:
+            best = sizes[k]
+    return tuple(edges), tuple(new_sizes), best
+
+
+def new_epoch() -> int:
+    """Start a new epoch and return its number.
+
+    Every Block remembers the latest epoch in which it or one of its
+    descendants changed, so whoever keeps track of a board can find what
+    changed since they last looked at it with Block.changed_since.
+    """
+    _EPOCH[0] += 1
+    return _EPOCH[0]
 
 
 def generate_board(max_depth: int, size: int) -> Block:
@@ -59,6 +262,10 @@ class Block:
     child's position. Indices 0, 1, 2, and 3 are the upper-right child,
     upper-left child, lower-left child, and lower-right child, respectively.
 
+    Positions below a block that was moved are refreshed lazily, so the
+    position of a block is only guaranteed to be current once it has been
+    reached through its ancestors' children.
+
     === Public Attributes ===
     position:
         The (x, y) coordinates of the upper left corner of this Block.
@@ -67,6 +274,10 @@ class Block:
     colour:
         If this block is not subdivided, <colour> stores its colour. Otherwise,
         <colour> is None.
+    colour_index:
+        The index of <colour> in settings.PALETTE, or NO_COLOUR if <colour> is
+        None. This is how the colour is actually stored; <colour> is derived
+        from it.
     level:
         The level of this block within the overall block structure.
         The outermost block, corresponding to the root of the tree,
@@ -92,12 +303,61 @@ class Block:
         - its colour is not None.
     - level <= max_depth
     """
+    # === Private Attributes ===
+    # _children:
+    #   The list behind <children>. It may still be waiting for a rotation,
+    #   so it should only be read through <children>.
+    # _pending:
+    #   The orientation tag of this block. None if <_children> are in their
+    #   final order and position. Otherwise, the number of clockwise quarter
+    #   turns that still have to be applied to <_children> and all their
+    #   descendants, before the children's positions are refreshed (0 means
+    #   only the positions need refreshing).
+    # _parent:
+    #   The block that this block is a child of, or None for the root.
+    # _colour:
+    #   The value behind <colour_index>.
+    # _hashes:
+    #   None if unknown. Otherwise _hashes[q] is the hash of this subtree as
+    #   it would be with <_children> turned q times clockwise, ignoring
+    #   _pending, and _hashes[4 + q] is the same for its mirror image, turned
+    #   q times clockwise after being mirrored left to right. If this is
+    #   known, it is also known for every descendant.
+    # _dirty:
+    #   _CLEAN if this block is up to date in the cached grid of its board,
+    #   _DIRTY if all of it has to be redrawn, or _DIRTY_BELOW if only some of
+    #   its descendants do. If a block is not _CLEAN, neither is its parent.
+    # _grid:
+    #   The cached result of flattened_grid if this block is the root of a
+    #   board and the grid has been asked for, otherwise None.
+    # _blobs:
+    #   None if no blob summary is known. Otherwise _blobs[c] is the blob
+    #   summary of this subtree for the colour with palette index c, if it is
+    #   known, ignoring _pending. If it is known, it is also known for every
+    #   descendant.
+    # _borders:
+    #   None if no border count is known. Otherwise _borders[e] is None or the
+    #   number of unit cells of each colour, by palette index, along edge e of
+    #   this subtree, ignoring _pending. Edges 0 to 3 are the top, right,
+    #   bottom and left edges. If an edge is known, it is also known for the
+    #   children along that edge.
+    # _epoch:
+    #   The latest epoch in which this block or one of its descendants was
+    #   created or changed. It is never later than the epoch of its parent.
     position: Tuple[int, int]
     size: int
-    colour: Optional[Tuple[int, int, int]]
     level: int
     max_depth: int
-    children: List[Block]
+    _colour: int
+    _children: List[Block]
+    _pending: Optional[int]
+    _parent: Optional[Block]
+    _hashes: Optional[Tuple[int, ...]]
+    _dirty: int
+    _grid: Optional[numpy.ndarray]
+    _blobs: Optional[Dict[int, Tuple]]
+    _borders: Optional[List[Optional[Dict[int, int]]]]
+    _epoch: int
 
     def __init__(self, position: Tuple[int, int], size: int,
                  colour: Optional[Tuple[int, int, int]], level: int,
@@ -113,10 +373,390 @@ class Block:
         """
         self.position = position
         self.size = size
-        self.colour = colour
+        self._colour = colour_index(colour)
         self.level = level
         self.max_depth = max_depth
-        self.children = []
+        self._children = []
+        self._pending = None
+        self._parent = None
+        self._hashes = None
+        self._dirty = _DIRTY
+        self._grid = None
+        self._blobs = None
+        self._borders = None
+        self._epoch = _EPOCH[0]
+
+    @property
+    def colour(self) -> Optional[Tuple[int, int, int]]:
+        """The colour of this block if it is not subdivided, otherwise None.
+        """
+        return index_colour(self._colour)
+
+    @colour.setter
+    def colour(self, colour: Optional[Tuple[int, int, int]]) -> None:
+        self.colour_index = colour_index(colour)
+
+    @property
+    def colour_index(self) -> int:
+        """The palette index of this block's colour, or NO_COLOUR.
+        """
+        return self._colour
+
+    @colour_index.setter
+    def colour_index(self, index: int) -> None:
+        if index != self._colour:
+            self._colour = index
+            self._invalidate()
+
+    @property
+    def children(self) -> List[Block]:
+        """The blocks into which this block is subdivided.
+
+        Rotations are applied lazily, so reading the children of a block first
+        pushes its orientation tag down one level.
+        """
+        if self._pending is not None:
+            self._push()
+        return self._children
+
+    @children.setter
+    def children(self, children: List[Block]) -> None:
+        self._settle()
+        self._children = children
+        self._pending = None
+        for child in children:
+            child._parent = self
+        self._invalidate()
+
+    def _push(self) -> None:
+        """Apply this block's orientation tag to its children: put them in
+        their final order and position, and pass the rotation on to their own
+        children.
+        """
+        turns = self._pending
+        self._pending = None
+        kids = self._children
+        if not kids:
+            return
+        if turns:
+            # A clockwise turn moves each child one place towards the front.
+            kids[:] = kids[turns:] + kids[:turns]
+            if self._hashes is not None:
+                # Mirroring turns the other way: the mirror image of this
+                # block turned clockwise is the mirror image turned
+                # counter-clockwise.
+                turned, mirrored = self._hashes[:4], self._hashes[4:]
+                self._hashes = turned[turns:] + turned[:turns] + \
+                    mirrored[-turns:] + mirrored[:-turns]
+            if self._blobs is not None:
+                for colour in self._blobs:
+                    self._blobs[colour] = _rotate_summary(self._blobs[colour],
+                                                          turns)
+            if self._borders is not None:
+                self._borders = self._borders[-turns:] + \
+                    self._borders[:-turns]
+        positions = self._children_positions()
+        for i in range(4):
+            child = kids[i]
+            child.position = positions[i]
+            child._parent = self
+            if child._children:
+                child._pending = ((child._pending or 0) + turns) % 4
+
+    def _settle(self) -> None:
+        """Push down every orientation tag between the root and this block, so
+        this block and its children are where they would be had every rotation
+        been done eagerly.
+
+        This must be done before changing the structure below this block in a
+        way that does not commute with a rotation.
+        """
+        chain = []
+        block = self
+        while block is not None:
+            chain.append(block)
+            block = block._parent
+        for block in reversed(chain):
+            if block._pending is not None:
+                block._push()
+
+    def _invalidate(self) -> None:
+        """Forget the cached hash, blob summaries and border counts of this
+        block and of all its ancestors, mark this block as needing to be
+        redrawn in the cached grid, and mark it and its ancestors as changed in
+        the current epoch.
+        """
+        block = self
+        while block is not None and (block._hashes is not None or
+                                     block._blobs is not None or
+                                     block._borders is not None):
+            block._hashes = None
+            block._blobs = None
+            block._borders = None
+            block = block._parent
+        self._dirty = _DIRTY
+        block = self._parent
+        while block is not None and block._dirty == _CLEAN:
+            block._dirty = _DIRTY_BELOW
+            block = block._parent
+        block = self
+        while block is not None and block._epoch != _EPOCH[0]:
+            block._epoch = _EPOCH[0]
+            block = block._parent
+
+    def changed_since(self, epoch: int) -> bool:
+        """Return True iff this Block or one of its descendants was created or
+        changed during or after <epoch>, as returned by new_epoch.
+        """
+        return self._epoch >= epoch
+
+    def _rotated_hash(self, turns: int, mirrored: bool = False) -> int:
+        """Return the hash of this subtree after <turns> more clockwise quarter
+        turns, taking its orientation tag into account. If <mirrored> is True,
+        the subtree is mirrored left to right before it is turned.
+        """
+        if self._hashes is None:
+            self._compute_hashes()
+        pending = self._pending or 0
+        if mirrored:
+            # Mirroring undoes the pending clockwise turns of the subtree.
+            return self._hashes[4 + (turns - pending) % 4]
+        return self._hashes[(pending + turns) % 4]
+
+    def _compute_hashes(self) -> None:
+        """Compute and cache the hashes of this subtree in each orientation
+        and in each orientation of its mirror image, reusing whatever is
+        already cached below it.
+        """
+        kids = self._children
+        if not kids:
+            self._hashes = (_leaf_key(self.level, self._colour),) * 8
+            return
+        # views[j] lists the hashes of child j in the same order as _hashes,
+        # with its orientation tag taken into account.
+        views = []
+        for child in kids:
+            child._parent = self
+            if child._hashes is None:
+                child._compute_hashes()
+            pending = child._pending or 0
+            h = child._hashes
+            views.append([h[(pending + q) % 4] for q in range(4)] +
+                         [h[4 + (q - pending) % 4] for q in range(4)])
+        keys = [_parent_key(self.level, i) for i in range(4)]
+        hashes = []
+        for order in ((0, 1, 2, 3), (1, 0, 3, 2)):
+            for turns in range(4):
+                variant = turns + (4 if order[0] else 0)
+                # A polynomial in the keyed child hashes, mixed once, costs
+                # one _splitmix per variant rather than one per child.
+                x = 0
+                for i in range(4):
+                    x = (x * _MIX +
+                         (views[order[(i + turns) % 4]][variant] ^ keys[i])) \
+                        & _MASK
+                hashes.append(_splitmix(x))
+        self._hashes = tuple(hashes)
+
+    def board_hash(self, turns: int = 0, mirrored: bool = False) -> int:
+        """Return a 64-bit hash of this Block and all its descendants, as they
+        would be after <turns> more clockwise quarter turns. If <mirrored> is
+        True, the Block is mirrored left to right before it is turned.
+
+        Equal boards always have equal hashes. The hash of every block is
+        cached, and a move only forgets the cached hashes between the moved
+        block and the root, so hashing after a move takes O(depth) time.
+        """
+        return _splitmix(self._rotated_hash(turns, mirrored) ^ self.max_depth)
+
+    def canonical_symmetry(self) -> Tuple[int, bool]:
+        """Return the number of clockwise quarter turns, and whether to mirror
+        this Block left to right before turning it, that take it to its
+        canonical orientation: the one of its eight orientations with the
+        smallest cached hash.
+
+        Boards that are rotations or reflections of each other are all taken
+        to the same board by their canonical symmetries.
+        """
+        if self._hashes is None:
+            self._compute_hashes()
+        k = self._hashes.index(min(self._hashes))
+        pending = self._pending or 0
+        if k < 4:
+            return (k - pending) % 4, False
+        return (k - 4 + pending) % 4, True
+
+    def canonical_hash(self) -> int:
+        """Return the board_hash of this Block under its canonical_symmetry.
+
+        Boards that are rotations or reflections of each other, and so have
+        the same score for every goal, have the same canonical hash. It is
+        read from the cached hashes of this Block in its eight orientations,
+        without building any of the eight boards.
+        """
+        if self._hashes is None:
+            self._compute_hashes()
+        return _splitmix(min(self._hashes) ^ self.max_depth)
+
+    def _blob_summary(self, colour: int) -> Tuple:
+        """Return the blob summary of this subtree for the colour with palette
+        index <colour>, ignoring its orientation tag, computing and caching
+        whatever is not cached yet.
+        """
+        if self._blobs is None:
+            self._blobs = {}
+        summary = self._blobs.get(colour)
+        if summary is None:
+            kids = self._children
+            if not kids:
+                summary = _leaf_summary(2 ** (self.max_depth - self.level),
+                                        self._colour == colour)
+            else:
+                views = []
+                for kid in kids:
+                    kid._parent = self
+                    views.append(_rotate_summary(kid._blob_summary(colour),
+                                                 kid._pending or 0))
+                summary = _merge_summaries(views)
+            self._blobs[colour] = summary
+        return summary
+
+    def blob_size(self, colour: int) -> int:
+        """Return the number of unit cells in the largest blob of the colour
+        with palette index <colour> in this Block.
+
+        Each block caches a summary of the blobs along its edges, which is
+        merged from its children's summaries. A move only forgets the
+        summaries between the moved block and the root, so after a small move
+        this takes roughly O(depth * edge length) time.
+        """
+        _, sizes, best = self._blob_summary(colour)
+        return max((best,) + sizes)
+
+    def _border(self, edge: int) -> Dict[int, int]:
+        """Return the number of unit cells of each colour, by palette index,
+        along <edge> of this subtree, ignoring its orientation tag. Only the
+        blocks along that edge are visited, and what they find is cached.
+        """
+        if self._borders is None:
+            self._borders = [None, None, None, None]
+        counts = self._borders[edge]
+        if counts is None:
+            kids = self._children
+            if not kids:
+                counts = {self._colour: 2 ** (self.max_depth - self.level)}
+            else:
+                counts = {}
+                for i in _EDGE_CHILDREN[edge]:
+                    kid = kids[i]
+                    kid._parent = self
+                    # A clockwise turn brings edge e - 1 round to edge e.
+                    kid_edge = (edge - (kid._pending or 0)) % 4
+                    for colour, n in kid._border(kid_edge).items():
+                        counts[colour] = counts.get(colour, 0) + n
+            self._borders[edge] = counts
+        return counts
+
+    def border_counts(self) -> Dict[int, int]:
+        """Return the number of unit cells of each colour, by palette index,
+        along the four edges of this Block, counting corner cells twice.
+
+        Each leaf on the border adds 2^(max_depth - level) cells per edge. The
+        counts are cached per block and per edge, and a move only forgets them
+        between the moved block and the root.
+        """
+        counts = {}
+        for edge in range(4):
+            for colour, n in self._border(edge).items():
+                counts[colour] = counts.get(colour, 0) + n
+        return counts
+
+    def edge_counts(self, edge: int) -> Dict[int, int]:
+        """Return the number of unit cells of each colour, by palette index,
+        along <edge> of this Block, where edges 0 to 3 are its top, right,
+        bottom and left edges.
+        """
+        return self._border((edge - (self._pending or 0)) % 4)
+
+    def border_edges(self) -> List[int]:
+        """Return the edges of this Block, numbered as in edge_counts, that lie
+        along the border of the board it belongs to.
+        """
+        self._settle()
+        edges = [0, 1, 2, 3]
+        block = self
+        while block._parent is not None:
+            parent = block._parent
+            i = next(i for i in range(4) if parent._children[i] is block)
+            edges = [edge for edge in edges if i in _EDGE_CHILDREN[edge]]
+            block = parent
+        return edges
+
+    def path(self) -> List[int]:
+        """Return the child indices leading from the root of the board this
+        Block belongs to down to this Block.
+        """
+        self._settle()
+        path = []
+        block = self
+        while block._parent is not None:
+            parent = block._parent
+            path.append(next(i for i in range(4)
+                             if parent._children[i] is block))
+            block = parent
+        path.reverse()
+        return path
+
+    def flattened_grid(self) -> Optional[numpy.ndarray]:
+        """Return this board flattened into a square int16 NumPy array of
+        palette indices, as goal._flatten_grid does, or None if this block is
+        not the root of a board or numpy is not available.
+
+        The grid is cached, and a move marks the blocks it changed as dirty, so
+        only the dirty regions are redrawn when the grid is next asked for. The
+        returned array is the cache itself and must not be modified.
+        """
+        if numpy is None or self._parent is not None:
+            return None
+        side = 2 ** (self.max_depth - self.level)
+        if self._grid is None:
+            self._grid = numpy.empty((side, side), dtype=numpy.int16)
+            self._dirty = _DIRTY
+        stack = [(self, 0, 0, side)]
+        while stack:
+            b, x, y, size = stack.pop()
+            if b._dirty == _DIRTY:
+                b._draw(self._grid, x, y, size)
+            elif b._dirty == _DIRTY_BELOW:
+                b._dirty = _CLEAN
+                half = size // 2
+                children = b.children
+                stack.append((children[0], x + half, y, half))
+                stack.append((children[1], x, y, half))
+                stack.append((children[2], x, y + half, half))
+                stack.append((children[3], x + half, y + half, half))
+        return self._grid
+
+    def _draw(self, grid: numpy.ndarray, x: int, y: int, size: int) -> None:
+        """Draw this whole block into the <size> by <size> square of <grid>
+        whose first column is <x> and first row is <y>, and mark it and all
+        its descendants as clean.
+        """
+        stack = [(self, x, y, size)]
+        while stack:
+            b, x, y, size = stack.pop()
+            b._dirty = _CLEAN
+            children = b.children
+            if size == 1 or not children:
+                grid[x:x + size, y:y + size] = b._colour
+            else:
+                half = size // 2
+                for child in children:
+                    child._parent = b
+                stack.append((children[0], x + half, y, half))
+                stack.append((children[1], x, y, half))
+                stack.append((children[2], x, y + half, half))
+                stack.append((children[3], x + half, y + half, half))
 
     def __str__(self) -> str:
         """Return this Block in a string format.
@@ -148,7 +788,7 @@ class Block:
             # Both self and other are leaves.
             return self.position == other.position and \
                    self.size == other.size and \
-                   self.colour == other.colour and \
+                   self.colour_index == other.colour_index and \
                    self.level == other.level and \
                    self.max_depth == other.max_depth
         elif len(self.children) != len(other.children):
@@ -185,15 +825,15 @@ class Block:
 
         <position> is the (x, y) coordinates of the upper-left corner of this
         Block.
+
+        A position is fully determined by the path from the root, so the
+        descendants are not visited here. Instead this Block is tagged, and
+        each level of positions is recomputed the next time it is reached
+        through <children>, as part of whatever traversal needs it.
         """
-        # do we only update the first children, or grandchildren too?
-        # ie, is this recursive or not? THIS IS RECURSIVE
-        if self.children:
-            self.position = position
-            temp = self._children_positions()
-            for x in range(4):
-                self.children[x].position = temp[x]
-                self.children[x]._update_children_positions(temp[x])
+        self.position = position
+        if self._children and self._pending is None:
+            self._pending = 0
 
     def smashable(self) -> bool:
         """Return True iff this block can be smashed.
@@ -203,17 +843,20 @@ class Block:
         """
         return self.level != self.max_depth and len(self.children) == 0
 
-    def smash(self) -> bool:
+    def smash(self, rng: Optional[random.Random] = None) -> bool:
         """Sub-divide this block so that it has four randomly generated
         children.
 
         If this Block's level is <max_depth>, do nothing. If this block has
         children, do nothing.
 
-        Return True iff the smash was performed.
+        Return True iff the smash was performed. The random choices are made
+        with <rng>, or with the random module if <rng> is None.
         """
         if not self.smashable():
             return False
+        if rng is None:
+            rng = random
         new_size = self._child_size()
         max_depth = self.max_depth
         level = self.level + 1
@@ -226,12 +869,12 @@ class Block:
         self.colour = None
 
         for child in self.children:
-            ran = random.random()
+            ran = rng.random()
             if ran < math.exp(-0.25 * self.level):
-                if not child.smash():
-                    child.colour = random.choice(COLOUR_LIST)
+                if not child.smash(rng):
+                    child.colour = rng.choice(COLOUR_LIST)
             else:
-                child.colour = random.choice(COLOUR_LIST)
+                child.colour = rng.choice(COLOUR_LIST)
         return True
 
     def swap(self, direction: int) -> bool:
@@ -246,6 +889,8 @@ class Block:
         """
         # swap first child or grand children too?
         # is it recursive?
+        # A swap does not commute with a pending rotation above this block.
+        self._settle()
         if len(self.children) == 0:
             return False
         if direction == 1:
@@ -259,11 +904,16 @@ class Block:
             self.children[3], self.children[2] = self.children[2], \
                                                  self.children[3]
         self._update_children_positions(self.position)
+        self._invalidate()
         return True
 
     def rotate(self, direction: int) -> bool:
         """Rotate this Block and all its descendants.
 
+        This takes constant time: the rotation is recorded in this Block's
+        orientation tag and only applied to its descendants as they are
+        visited.
+
         If this Block has no children, do nothing. If <direction> is 1, rotate
         clockwise. If <direction> is 3, rotate counter-clockwise.
 
@@ -271,19 +921,13 @@ class Block:
 
         Precondition: <direction> is either 1 or 3.
         """
-        if len(self.children) == 0:
+        if not self._children:
             return False
-        if direction == 1:
-            temp = self.children.pop(0)
-            self.children.append(temp)
-            for x in range(4):
-                self.children[x].rotate(direction)
-        else:
-            temp = self.children.pop()
-            self.children.insert(0, temp)
-            for x in range(4):
-                self.children[x].rotate(direction)
-        self._update_children_positions(self.position)
+        # Rotations commute with each other, so this only has to be recorded
+        # in the orientation tag. It is applied when the children are needed.
+        turns = 1 if direction == 1 else 3
+        self._pending = ((self._pending or 0) + turns) % 4
+        self._invalidate()
         return True
 
     def paint(self, colour: Tuple[int, int, int]) -> bool:
@@ -292,12 +936,21 @@ class Block:
 
         Return True iff this Block's colour was changed.
         """
-        if self.level == self.max_depth and self.colour != colour and \
+        index = colour_index(colour)
+        if self.level == self.max_depth and self._colour != index and \
                 not self.children:
-            self.colour = colour
+            self.colour_index = index
             return True
         return False
 
+    def combine_colour(self) -> Optional[int]:
+        """Return the palette index of the colour that this Block would be
+        turned into by combine, or None if it cannot be combined.
+        """
+        if self.level != self.max_depth - 1 or not self.children:
+            return None
+        return _majority([child.colour_index for child in self.children])
+
     def combine(self) -> bool:
         """Turn this Block into a leaf based on the majority colour of its
         children.
@@ -311,46 +964,34 @@ class Block:
 
         Return True iff this Block was turned into a leaf node.
         """
-        if self.level != self.max_depth - 1 or len(self.children) == 0:
+        winner = self.combine_colour()
+        if winner is None:
             return False
-        stuff = {}
-        for child in self.children:
-            if child.colour not in stuff:
-                stuff[child.colour] = 1
-            else:
-                stuff[child.colour] += 1
-        high = 0
-        high_item = None
-        same = False
-        for key in stuff:
-            if stuff[key] > high:
-                same = False
-                high = stuff[key]
-                high_item = key
-            elif stuff[key] == high:
-                same = True
-        if not same:
-            self.colour = high_item
-            self.children = []
-            return True
-        return False
+        self.colour_index = winner
+        self.children = []
+        return True
 
     def create_copy(self) -> Block:
         """Return a new Block that is a deep copy of this Block.
 
         Remember that a deep copy has new blocks (not aliases) at every level.
         """
-        pos = self.position
-        size = self.size
-        colour = self.colour
-        level = self.level
-        max_depth = self.max_depth
-        child = []
-        if self.children:
-            for kid in self.children:
-                child.append(kid.create_copy())
-        copy = Block(pos, size, colour, level, max_depth)
-        copy.children = child
+        copy = Block(self.position, self.size, None, self.level,
+                     self.max_depth)
+        copy._colour = self._colour
+        # Pending rotations are copied as they are rather than applied.
+        copy._children = [kid.create_copy() for kid in self._children]
+        copy._pending = self._pending
+        copy._hashes = self._hashes
+        copy._dirty = self._dirty
+        if self._blobs is not None:
+            copy._blobs = dict(self._blobs)
+        if self._borders is not None:
+            copy._borders = list(self._borders)
+        if self._grid is not None:
+            copy._grid = self._grid.copy()
+        for kid in copy._children:
+            kid._parent = copy
         return copy
 
 
@@ -360,7 +1001,7 @@ if __name__ == '__main__':
     python_ta.check_all(config={
         'allowed-import-modules': [
             'doctest', 'python_ta', 'random', 'typing', '__future__', 'math',
-            'settings'
+            'settings', 'numpy'
         ],
         'max-attributes': 15,
         'max-args': 6
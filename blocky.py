@@ -29,6 +29,7 @@ import pygame
 from actions import ACTION_MESSAGE, ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE,\
     SWAP_HORIZONTAL, SWAP_VERTICAL, SMASH, PASS, PAINT, COMBINE, ACTION_PENALTY
 from block import Block
+from goal import score_all
 from player import Player
 from renderer import Renderer
 from settings import ANIMATION_DURATION
@@ -112,11 +113,27 @@ class GameData:
         """
         goal_score = self.players[player_id].goal.score(self.board)
 
-        penalty = self.smashes[player_id] * ACTION_PENALTY[SMASH] + \
-                  self.combines[player_id] * ACTION_PENALTY[COMBINE] + \
-                  self.paints[player_id] * ACTION_PENALTY[PAINT]
+        return goal_score, self._penalty(player_id)
 
-        return goal_score, penalty
+    def calculate_scores(self) -> List[Tuple[int, int]]:
+        """Return the result of calculate_score for every player, in the same
+        order as <players>.
+
+        The board is scored for all the players' goals together, which costs
+        about as much as scoring it for one of them.
+        """
+        goal_scores = score_all(self.board,
+                                [player.goal for player in self.players])
+        return [(goal_scores[i], self._penalty(self.players[i].id))
+                for i in range(len(self.players))]
+
+    def _penalty(self, player_id: int) -> int:
+        """Return the deductions from <player_id>'s score based on the actions
+        they've taken.
+        """
+        return self.smashes[player_id] * ACTION_PENALTY[SMASH] + \
+               self.combines[player_id] * ACTION_PENALTY[COMBINE] + \
+               self.paints[player_id] * ACTION_PENALTY[PAINT]
 
 
 class GameState:
@@ -334,11 +351,14 @@ class GameOverState(GameState):
         """Initialize this GameState.
         """
         self._scores = []
-        for p in data.players:
-            goal_score, penalty = data.calculate_score(p.id)
-            self._scores.append((p.id, goal_score, penalty))
+        scores = data.calculate_scores()
+        for i in range(len(data.players)):
+            goal_score, penalty = scores[i]
+            self._scores.append((data.players[i].id, goal_score, penalty))
 
         self._winner = max(self._scores, key=lambda item: item[1] - item[2])[0]
+        for player in data.players:
+            player.close()
 
     def process_event(self, event: pygame.event.Event) -> None:
         # Simply ignore the event
@@ -370,7 +390,7 @@ if __name__ == '__main__':
         'allowed-io': ['run_game'],
         'allowed-import-modules': [
             'doctest', 'python_ta', 'random', 'typing', 'pygame', '__future__',
-            'block', 'player', 'renderer', 'settings', 'actions'
+            'block', 'goal', 'player', 'renderer', 'settings', 'actions'
         ],
         'generated-members': 'pygame.*'
     })
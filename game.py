@@ -52,14 +52,17 @@ class Game:
     def __init__(self, max_depth: int,
                  num_human: int,
                  num_random: int,
-                 smart_players: List[int]) -> None:
-        """Initialize this game, as described in the Assignment 2 handout.
+                 smart_players: List[int],
+                 num_alpha_beta: int = 0) -> None:
+        """Initialize this game, as described in the Assignment 2 handout,
+        with <num_alpha_beta> AlphaBetaPlayers after the other players.
 
         Precondition:
             2 <= max_depth <= 5
         """
         board = generate_board(max_depth, BOARD_SIZE)
-        players = create_players(num_human, num_random, smart_players)
+        players = create_players(num_human, num_random, smart_players,
+                                 num_alpha_beta)
 
         self._renderer = Renderer(BOARD_SIZE)
         self._data = GameData(board, players)
@@ -110,6 +113,13 @@ def create_solitaire_game() -> Game:
     return Game(3, 1, 0, [])
 
 
+def create_alpha_beta_game() -> Game:
+    """Run a game with one human player against one player that searches
+    ahead through both players' moves.
+    """
+    return Game(3, 1, 0, [], 1)
+
+
 def create_sample_game() -> Game:
     """Run a sample game with one human player, one random player,
     and one smart player.
@@ -137,6 +147,7 @@ if __name__ == '__main__':
 
     # game = create_sample_game()
     # game = create_auto_game()
+    # game = create_alpha_beta_game()
     game = create_two_player_game()
     # game = create_solitaire_game()
 
@@ -24,9 +24,16 @@ This file contains the hierarchy of Goal classes.
 from __future__ import annotations
 
 import random
-from typing import List, Tuple
-from block import Block
-from settings import colour_name, COLOUR_LIST
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple, Union
+from block import Block, _find
+from journal import MoveJournal
+try:
+    import numpy
+except ImportError:  # numpy is optional, the pure Python engine is used instead
+    numpy = None
+from settings import colour_name, colour_index, index_colour, COLOUR_LIST, \
+    SCORE_CACHE_CAPACITY
 
 
 def generate_goals(num_goals: int) -> List[Goal]:
@@ -71,25 +78,77 @@ def _flatten(block: Block) -> List[List[Tuple[int, int, int]]]:
 
     L[0][0] represents the unit cell in the upper left corner of the Block.
     """
+    return [[index_colour(cell) for cell in column]
+            for column in _flatten_indices(block)]
+
+
+def _flatten_indices(block: Block) -> List[List[int]]:
+    """Return <block> flattened into unit cells as described in _flatten, but
+    with each cell holding the palette index of its colour rather than an RGB
+    tuple. This is the representation that the goals score.
+    """
+    if numpy is not None:
+        return _flatten_grid(block).tolist()
+    return _flatten_lists(block)
+
+
+def _flatten_grid(block: Block) -> numpy.ndarray:
+    """Return <block> flattened into a square int16 NumPy array of palette
+    indices, where grid[i, j] is the unit cell at column i and row j, as in
+    _flatten.
+
+    The array is allocated once at its full size and each leaf fills its
+    square with a single slice assignment, so no intermediate lists are built.
+    A whole board uses its cached grid instead, which only redraws the blocks
+    that changed since it was last flattened. The result must not be
+    modified.
+
+    Precondition: numpy is available.
+    """
+    if isinstance(block, Block):
+        grid = block.flattened_grid()
+        if grid is not None:
+            return grid
+    side = 2 ** (block.max_depth - block.level)
+    grid = numpy.empty((side, side), dtype=numpy.int16)
+    stack = [(block, 0, 0, side)]
+    while stack:
+        b, x, y, size = stack.pop()
+        children = b.children
+        if size == 1 or not children:
+            grid[x:x + size, y:y + size] = b.colour_index
+        else:
+            half = size // 2
+            stack.append((children[0], x + half, y, half))
+            stack.append((children[1], x, y, half))
+            stack.append((children[2], x, y + half, half))
+            stack.append((children[3], x + half, y + half, half))
+    return grid
+
+
+def _flatten_lists(block: Block) -> List[List[int]]:
+    """Return the same result as _flatten_indices, built from nested lists
+    without NumPy.
+    """
     if block.level == block.max_depth:  # if its a unit block already
-        return [[block.colour]]
+        return [[block.colour_index]]
     elif not block.children:  # not a unit block, but doesnt have children
         side = 2**(block.max_depth - block.level)
         flat = []
         for _ in range(side):
             row = []
             for _ in range(side):
-                row.append(block.colour)
+                row.append(block.colour_index)
             flat.append(row)
         return flat
     else:  # not a unit block, and HAS children
         # 2  1
         # 3  4
         flat = []
-        one = _flatten(block.children[0])
-        two = _flatten(block.children[1])
-        three = _flatten(block.children[2])
-        four = _flatten(block.children[3])
+        one = _flatten_lists(block.children[0])
+        two = _flatten_lists(block.children[1])
+        three = _flatten_lists(block.children[2])
+        four = _flatten_lists(block.children[3])
         if len(one) == 1:  # if it looks like this: [[unit]]
             # note: if one is a unit, then all are units
             # returns a 2x2
@@ -108,6 +167,465 @@ def _flatten(block: Block) -> List[List[Tuple[int, int, int]]]:
             return flat
 
 
+def _target_runs(board: Block, target: int) -> List[List[Tuple[int, int]]]:
+    """Return the vertical runs of cells of the colour with palette index
+    <target> on <board> flattened as in _flatten_indices.
+
+    runs[i] lists the runs in column i from top to bottom. A run (start, end)
+    covers the cells in rows start to end - 1 of its column, and cannot be
+    made any longer.
+    """
+    if numpy is not None:
+        mask = _flatten_grid(board) == target
+        side = mask.shape[0]
+        edges = numpy.zeros((side, side + 1), dtype=numpy.int8)
+        edges[:, 1:] = mask
+        edges[:, :-1] -= mask
+        # edges[i, j] is -1 where a run starts at row j and 1 where the run
+        # before row j ends; both come out of nonzero in row-major order.
+        cols, starts = numpy.nonzero(edges == -1)
+        ends = numpy.nonzero(edges == 1)[1]
+        runs = [[] for _ in range(side)]
+        for i, start, end in zip(cols.tolist(), starts.tolist(),
+                                 ends.tolist()):
+            runs[i].append((start, end))
+        return runs
+    runs = []
+    for column in _flatten_lists(board):
+        col_runs = []
+        start = None
+        for j in range(len(column)):
+            if column[j] == target:
+                if start is None:
+                    start = j
+            elif start is not None:
+                col_runs.append((start, j))
+                start = None
+        if start is not None:
+            col_runs.append((start, len(column)))
+        runs.append(col_runs)
+    return runs
+
+
+def _union(parent: List[int], sizes: List[int], a: int, b: int) -> None:
+    """Join the sets of <a> and <b> in the union-find forest <parent>, where
+    sizes[k] is the size of the set that k represents.
+    """
+    a = _find(parent, a)
+    b = _find(parent, b)
+    if a != b:
+        if sizes[a] < sizes[b]:
+            a, b = b, a
+        parent[b] = a
+        sizes[a] += sizes[b]
+
+
+def _largest_blob(runs: List[List[Tuple[int, int]]]) -> int:
+    """Return the number of cells in the largest blob made of <runs>, as
+    produced by _target_runs.
+
+    Runs in neighbouring columns that share a row belong to the same blob.
+    They are joined with a union-find over the runs rather than the cells, and
+    each column is only compared with the next one, so there is no recursion.
+    """
+    parent = []
+    sizes = []
+    prev_ids = []
+    prev_runs = []
+    for col_runs in runs:
+        ids = []
+        for start, end in col_runs:
+            ids.append(len(parent))
+            parent.append(len(parent))
+            sizes.append(end - start)
+        # Walk both columns' runs together, joining the ones that overlap.
+        i = j = 0
+        while i < len(prev_runs) and j < len(col_runs):
+            a_start, a_end = prev_runs[i]
+            b_start, b_end = col_runs[j]
+            if a_start < b_end and b_start < a_end:
+                _union(parent, sizes, prev_ids[i], ids[j])
+            if a_end < b_end:
+                i += 1
+            else:
+                j += 1
+        prev_ids, prev_runs = ids, col_runs
+    best = 0
+    for k in range(len(parent)):
+        if parent[k] == k and sizes[k] > best:
+            best = sizes[k]
+    return best
+
+
+class _LeafBlobs:
+    """The blobs of some colours on a board, found from the leaves of its
+    tree in a single pass. This is how boards without cached blob summaries,
+    such as a PersistentBlock, are scored when NumPy is available, and how
+    score_all finds the blobs of several colours at once.
+
+    Each leaf of a target colour is a region weighing as many unit cells as it
+    covers, and regions are joined wherever two leaves of the same colour
+    share an edge. The work is proportional to the number of leaves rather
+    than the number of unit cells.
+
+    The board's children are read once, into a tree of leaf numbers, so that
+    boards whose children are views made afresh on each read, such as an
+    ArenaBlock, are scored the same as a Block.
+    """
+    # === Private Attributes ===
+    # _targets:
+    #   The palette indices of the colours whose blobs are wanted.
+    # _colours:
+    #   The palette index of the colour of each numbered leaf.
+    # _parent:
+    #   The union-find forest over the leaf numbers.
+    # _sizes:
+    #   For each leaf number that represents a blob, the size of the blob.
+    _targets: Set[int]
+    _colours: List[int]
+    _parent: List[int]
+    _sizes: List[int]
+
+    def __init__(self, board: Block, targets: Set[int]) -> None:
+        """Find the blobs of the colours with palette indices <targets> on
+        <board>.
+        """
+        self._targets = targets
+        self._colours = []
+        self._parent = []
+        self._sizes = []
+        tree = self._number_leaves(board)
+        if self._parent:
+            self._join_inside(tree)
+
+    def largest(self, target: int) -> int:
+        """Return the number of unit cells in the largest blob of the colour
+        with palette index <target>, which must be one of the targets.
+        """
+        best = 0
+        for k in range(len(self._parent)):
+            if self._parent[k] == k and self._colours[k] == target and \
+                    self._sizes[k] > best:
+                best = self._sizes[k]
+        return best
+
+    def _number_leaves(self, block: Block) -> Union[int, Tuple]:
+        """Number every leaf of a target colour in <block>, and return the
+        tree of leaf numbers of <block>.
+
+        The tree of a leaf is its number, or -1 if it is not of a target
+        colour. The tree of a block with children is the tuple of the trees
+        of its children, in the same order.
+        """
+        children = block.children
+        if children:
+            return tuple(self._number_leaves(child) for child in children)
+        if block.colour_index not in self._targets:
+            return -1
+        self._colours.append(block.colour_index)
+        self._parent.append(len(self._parent))
+        self._sizes.append(4 ** (block.max_depth - block.level))
+        return len(self._parent) - 1
+
+    def _join_inside(self, tree: Union[int, Tuple]) -> None:
+        """Join the leaves in the tree of leaf numbers <tree> that share an
+        edge.
+        """
+        if not isinstance(tree, tuple):
+            return
+        for child in tree:
+            self._join_inside(child)
+        # 1  0
+        # 2  3
+        self._join_across(tree[1], tree[0], True)
+        self._join_across(tree[2], tree[3], True)
+        self._join_across(tree[1], tree[2], False)
+        self._join_across(tree[0], tree[3], False)
+
+    def _join_across(self, a: Union[int, Tuple], b: Union[int, Tuple],
+                     horizontal: bool) -> None:
+        """Join the leaves of the trees of leaf numbers <a> and <b> that meet
+        along the edge between them. <a> is to the left of <b> if
+        <horizontal>, otherwise above it, and both cover the whole edge.
+        """
+        a_kids = isinstance(a, tuple)
+        b_kids = isinstance(b, tuple)
+        if not a_kids and not b_kids:
+            if a >= 0 and b >= 0 and self._colours[a] == self._colours[b]:
+                self._union(a, b)
+            return
+        if (not a_kids and a < 0) or (not b_kids and b < 0):
+            return
+        # The children of each block that lie along the shared edge, in the
+        # same order for both blocks. A leaf lies along all of it.
+        if horizontal:
+            a_edge = (a[0], a[3]) if a_kids else (a, a)
+            b_edge = (b[1], b[2]) if b_kids else (b, b)
+        else:
+            a_edge = (a[2], a[3]) if a_kids else (a, a)
+            b_edge = (b[1], b[0]) if b_kids else (b, b)
+        self._join_across(a_edge[0], b_edge[0], horizontal)
+        self._join_across(a_edge[1], b_edge[1], horizontal)
+
+    def _union(self, a: int, b: int) -> None:
+        """Join the blobs of leaves <a> and <b>.
+        """
+        _union(self._parent, self._sizes, a, b)
+
+
+def _border_counts(board: Block) -> Dict[int, int]:
+    """Return the number of unit cells of each colour, by palette index, along
+    the four edges of <board>, counting corner cells twice.
+    """
+    if isinstance(board, Block):
+        return board.border_counts()
+    if numpy is not None:
+        grid = _flatten_grid(board)
+        edges = numpy.concatenate((grid[0], grid[-1], grid[:, 0],
+                                   grid[:, -1]))
+        # Shifted by one, so that NO_COLOUR can be counted too.
+        counts = numpy.bincount(edges + 1)
+        return {i - 1: int(counts[i])
+                for i in numpy.flatnonzero(counts).tolist()}
+    flat = _flatten_lists(board)
+    counts = {}
+    for i in range(len(flat)):
+        for cell in (flat[0][i], flat[-1][i], flat[i][0], flat[i][-1]):
+            counts[cell] = counts.get(cell, 0) + 1
+    return counts
+
+
+def _run_minimum(labels: numpy.ndarray, masks: numpy.ndarray) -> numpy.ndarray:
+    """Return <labels> with every cell replaced by the smallest label in the
+    run of equal <masks> cells along the last axis that it belongs to.
+
+    Precondition: numpy is available.
+    """
+    flat = numpy.ascontiguousarray(labels).ravel()
+    flat_mask = numpy.ascontiguousarray(masks).ravel()
+    starts = numpy.empty(flat.shape, dtype=bool)
+    starts[0] = True
+    starts[1:] = flat_mask[1:] != flat_mask[:-1]
+    starts[::masks.shape[-1]] = True
+    starts = numpy.flatnonzero(starts)
+    lengths = numpy.diff(numpy.append(starts, flat.shape[0]))
+    runs = numpy.repeat(numpy.minimum.reduceat(flat, starts), lengths)
+    return runs.reshape(labels.shape)
+
+
+def _largest_blobs(masks: numpy.ndarray) -> numpy.ndarray:
+    """Return the size of the largest blob of True cells in each grid of the
+    stack of boolean grids <masks>.
+
+    Every True cell starts out labelled with its own index in the whole stack.
+    Each round, every run of True cells along a column and then along a row
+    takes the smallest label in it, and then each cell takes the label of the
+    cell its label points to. Labels only ever point to cells of the same
+    blob, so once nothing changes every blob is labelled with its smallest
+    index.
+
+    Precondition: numpy is available.
+    """
+    n, side = masks.shape[0], masks.shape[1]
+    cells = n * side * side
+    flat_mask = masks.ravel()
+    labels = numpy.where(flat_mask, numpy.arange(cells), cells)
+    labels = labels.reshape(masks.shape)
+    rows = masks.transpose(0, 2, 1)
+    while True:
+        new = _run_minimum(labels, masks)
+        new = _run_minimum(new.transpose(0, 2, 1), rows).transpose(0, 2, 1)
+        new = numpy.ascontiguousarray(new)
+        flat = new.ravel()
+        flat[flat_mask] = flat[flat[flat_mask]]
+        if numpy.array_equal(new, labels):
+            break
+        labels = new
+    sizes = numpy.bincount(labels.ravel()[flat_mask], minlength=cells)
+    return sizes.reshape(n, side * side).max(axis=1)
+
+
+def _can_paint(block: Block, colour: int) -> bool:
+    """Return True iff <block> can be painted the colour with palette index
+    <colour>, as in Block.paint.
+    """
+    return block.level == block.max_depth and not block.children and \
+        block.colour_index != colour
+
+
+def _along(block: Block, edge: int, target: int) -> int:
+    """Return the number of cells of the colour with palette index <target>
+    along <edge> of <block>, numbered as in Block.edge_counts.
+    """
+    return block.edge_counts(edge).get(target, 0)
+
+
+def _counts_after(block: Block, action: str, direction: Optional[int],
+                  target: int, before: List[int]) -> Optional[List[int]]:
+    """Return the number of cells of the colour with palette index <target>
+    along each edge of <block> after the move <action> in <direction>, given
+    the numbers <before> it, or None if the move cannot be made. A paint uses
+    the colour <target>.
+    """
+    top, right, bottom, left = before
+    if action == 'rotate':
+        if not block.children:
+            return None
+        # A clockwise turn brings edge e - 1 round to edge e.
+        turns = 1 if direction == 1 else 3
+        return before[-turns:] + before[:-turns]
+    elif action == 'swap':
+        kids = block.children
+        if not kids:
+            return None
+        # The children move without turning, so the edges that change are
+        # made of what were the children's inner edges.
+        if direction == 1:
+            return [_along(kids[2], 0, target) + _along(kids[3], 0, target),
+                    right,
+                    _along(kids[0], 2, target) + _along(kids[1], 2, target),
+                    left]
+        return [top,
+                _along(kids[1], 1, target) + _along(kids[2], 1, target),
+                bottom,
+                _along(kids[0], 3, target) + _along(kids[3], 3, target)]
+    elif action == 'paint':
+        if not _can_paint(block, target):
+            return None
+        return [1, 1, 1, 1]
+    elif action == 'combine':
+        winner = block.combine_colour()
+        if winner is None:
+            return None
+        side = 2 ** (block.max_depth - block.level)
+        return [side if winner == target else 0] * 4
+    return None
+
+
+def score_all(board: Block, goals: List[Goal]) -> List[int]:
+    """Return the score of each of <goals> on <board>, in the same order.
+
+    The board is examined once for all the goals of each kind, rather than
+    once per goal: every PerimeterGoal reads the same count of the border
+    colours, and the blobs of every BlobGoal colour are labelled together.
+    Scores already in SCORE_CACHE are not computed again.
+    """
+    board_hash = board.canonical_hash() if isinstance(board, Block) \
+        else None
+    scores = []
+    perimeter = {}
+    blobs = {}
+    for goal in goals:
+        score = None
+        if board_hash is not None:
+            score = SCORE_CACHE.get(goal.cache_key(board_hash))
+        scores.append(score)
+        if score is None and isinstance(goal, PerimeterGoal):
+            perimeter[colour_index(goal.colour)] = 0
+        elif score is None and isinstance(goal, BlobGoal):
+            blobs[colour_index(goal.colour)] = 0
+    if perimeter:
+        counts = _border_counts(board)
+        for target in perimeter:
+            perimeter[target] = counts.get(target, 0)
+    if blobs:
+        if isinstance(board, Block):
+            for target in blobs:
+                blobs[target] = board.blob_size(target)
+        else:
+            found = _LeafBlobs(board, set(blobs))
+            for target in blobs:
+                blobs[target] = found.largest(target)
+    for i in range(len(goals)):
+        goal = goals[i]
+        if scores[i] is not None:
+            continue
+        if isinstance(goal, PerimeterGoal):
+            scores[i] = perimeter[colour_index(goal.colour)]
+        elif isinstance(goal, BlobGoal):
+            scores[i] = blobs[colour_index(goal.colour)]
+        else:
+            scores[i] = goal.score(board)
+        if board_hash is not None:
+            SCORE_CACHE.put(goal.cache_key(board_hash), scores[i])
+    return scores
+
+
+class ScoreCache:
+    """A bounded cache of goal scores, which forgets the least recently used
+    score once it is full.
+
+    Scores are keyed by the canonical hash of the board, the type of the goal
+    and the palette index of its colour, as produced by Goal.cache_key. Every
+    goal scores a board and its rotations and reflections the same, so they
+    all share one entry.
+
+    === Public Attributes ===
+    capacity:
+        The most scores that this cache keeps.
+    hits:
+        The number of lookups that found a score.
+    misses:
+        The number of lookups that did not.
+
+    === Representation Invariants ===
+    - len(self) <= capacity
+    """
+    # === Private Attributes ===
+    # _scores:
+    #   The cached scores, from the least to the most recently used.
+    capacity: int
+    hits: int
+    misses: int
+    _scores: OrderedDict
+
+    def __init__(self, capacity: int) -> None:
+        """Initialize an empty cache that keeps at most <capacity> scores.
+
+        Precondition: capacity >= 0
+        """
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._scores = OrderedDict()
+
+    def __len__(self) -> int:
+        """Return the number of scores in this cache.
+        """
+        return len(self._scores)
+
+    def get(self, key: Tuple[int, type, int]) -> Optional[int]:
+        """Return the score cached under <key>, or None if there is none.
+        """
+        score = self._scores.get(key)
+        if score is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._scores.move_to_end(key)
+        return score
+
+    def put(self, key: Tuple[int, type, int], score: int) -> None:
+        """Cache <score> under <key>, forgetting the least recently used
+        scores if the cache is over capacity.
+        """
+        self._scores[key] = score
+        self._scores.move_to_end(key)
+        while len(self._scores) > self.capacity:
+            self._scores.popitem(last=False)
+
+    def clear(self) -> None:
+        """Forget every score and reset the counters.
+        """
+        self._scores.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# The score cache shared by every goal, the game and the players.
+SCORE_CACHE = ScoreCache(SCORE_CACHE_CAPACITY)
+
+
 class Goal:
     """A player goal in the game of Blocky.
 
@@ -129,6 +647,105 @@ class Goal:
         """Return the current score for this goal on the given board.
 
         The score is always greater than or equal to 0.
+
+        The scores of Blocks are remembered in SCORE_CACHE, so scoring a board
+        that was scored recently, or any rotation or reflection of one, is a
+        dictionary lookup.
+        """
+        if not isinstance(board, Block):
+            return self._compute_score(board)
+        key = self.cache_key(board.canonical_hash())
+        score = SCORE_CACHE.get(key)
+        if score is None:
+            score = self._compute_score(board)
+            SCORE_CACHE.put(key, score)
+        return score
+
+    def cache_key(self, board_hash: int) -> Tuple[int, type, int]:
+        """Return the key under which this goal's score on a board with the
+        canonical hash <board_hash> is kept in SCORE_CACHE.
+        """
+        return board_hash, type(self), colour_index(self.colour)
+
+    def score_batch(self, boards: List[Block]) -> List[int]:
+        """Return the score for this goal on each of <boards>, in the same
+        order.
+
+        Scores are looked up in SCORE_CACHE first. The boards that are left
+        are flattened and stacked into one 3-D array per board size, which is
+        scored with a few vectorised NumPy operations instead of one Python
+        call per board. Without NumPy they are scored one at a time.
+        """
+        scores = []
+        keys = []
+        by_side = {}
+        for i in range(len(boards)):
+            board = boards[i]
+            key = None
+            score = None
+            if isinstance(board, Block):
+                key = self.cache_key(board.canonical_hash())
+                score = SCORE_CACHE.get(key)
+            keys.append(key)
+            scores.append(score)
+            if score is None:
+                side = 2 ** (board.max_depth - board.level)
+                by_side.setdefault(side, []).append(i)
+        for indices in by_side.values():
+            if numpy is not None:
+                grids = numpy.stack([_flatten_grid(boards[i])
+                                     for i in indices])
+                results = self._score_grids(grids).tolist()
+            else:
+                results = [self._compute_score(boards[i]) for i in indices]
+            for k in range(len(indices)):
+                i = indices[k]
+                scores[i] = int(results[k])
+                if keys[i] is not None:
+                    SCORE_CACHE.put(keys[i], scores[i])
+        return scores
+
+    def score_delta(self, board: Block,
+                    move: Tuple[str, Optional[int], Block],
+                    rng: Optional[random.Random] = None) -> int:
+        """Return how much the score for this goal on <board> would change if
+        <move> were made, painting with this goal's colour if it is a paint.
+
+        <move> is a move tuple as produced by player._create_move, for a block
+        in <board>. A move that cannot be made changes nothing. When the
+        change cannot be worked out from the moved block alone, the move is
+        applied, the board is scored and the move is undone. A smash is made
+        with <rng>, as in Block.smash.
+        """
+        delta = self._move_delta(move)
+        if delta is not None:
+            return delta
+        before = self.score(board)
+        journal = MoveJournal()
+        if not journal.apply(move, self.colour, rng):
+            return 0
+        after = self.score(board)
+        journal.undo()
+        return after - before
+
+    def _move_delta(self, move: Tuple[str, Optional[int], Block]) \
+            -> Optional[int]:
+        """Return how much <move> would change the score for this goal, or
+        None if that cannot be worked out without making the move.
+        """
+        return None
+
+    def _compute_score(self, board: Block) -> int:
+        """Return the score for this goal on <board>, without using the
+        cache.
+        """
+        raise NotImplementedError
+
+    def _score_grids(self, grids: numpy.ndarray) -> numpy.ndarray:
+        """Return the score for this goal on each board in <grids>, a stack of
+        grids as produced by _flatten_grid.
+
+        Precondition: numpy is available.
         """
         raise NotImplementedError
 
@@ -142,19 +759,32 @@ class PerimeterGoal(Goal):
     """ This is an instance of a perimeter goal.
     What is a perimeter goal is in the description
     """
-    def score(self, board: Block) -> int:
-        flat = _flatten(board)
-        score = 0
-        for i in range(len(flat)):
-            if flat[0][i] == self.colour:
-                score += 1
-            if flat[-1][i] == self.colour:
-                score += 1
-            if flat[i][0] == self.colour:
-                score += 1
-            if flat[i][-1] == self.colour:
-                score += 1
-        return score
+    def _compute_score(self, board: Block) -> int:
+        return _border_counts(board).get(colour_index(self.colour), 0)
+
+    def _move_delta(self, move: Tuple[str, Optional[int], Block]) \
+            -> Optional[int]:
+        # Only the cells of the moved block can change, so the change is the
+        # difference in target cells along its edges that are on the border.
+        action, direction, block = move
+        if action == 'pass':
+            return 0
+        if not isinstance(block, Block) or action == 'smash':
+            return None
+        target = colour_index(self.colour)
+        edges = block.border_edges()
+        if not edges:
+            return 0
+        before = [_along(block, edge, target) for edge in range(4)]
+        after = _counts_after(block, action, direction, target, before)
+        if after is None:
+            return 0
+        return sum(after[edge] - before[edge] for edge in edges)
+
+    def _score_grids(self, grids: numpy.ndarray) -> numpy.ndarray:
+        mask = grids == colour_index(self.colour)
+        return mask[:, 0].sum(axis=1) + mask[:, -1].sum(axis=1) + \
+            mask[:, :, 0].sum(axis=1) + mask[:, :, -1].sum(axis=1)
 
     def description(self) -> str:
         return 'Make the largest ' + colour_name(self.colour) + \
@@ -165,24 +795,42 @@ class BlobGoal(Goal):
     """This is an instance of a blob goal.
     What a blob goal is in description
     """
-    def score(self, board: Block) -> int:
-        flat = _flatten(board)
-        visited = []
-        for i in range(len(flat)):
-            col = []
-            for _ in range(len(flat)):
-                col.append(-1)
-            visited.append(col)
-        score = 0
-        for i in range(len(flat)):
-            for j in range(len(flat)):
-                temp_score = self._undiscovered_blob_size((i, j), flat, visited)
-                if temp_score > score:
-                    score = temp_score
-        return score
+    def _compute_score(self, board: Block) -> int:
+        target = colour_index(self.colour)
+        if isinstance(board, Block):
+            return board.blob_size(target)
+        if numpy is None:
+            # Without NumPy, flattening to lists and joining column runs is
+            # usually cheaper than walking the leaves one call at a time.
+            return _largest_blob(_target_runs(board, target))
+        return _LeafBlobs(board, {target}).largest(target)
+
+    def _move_delta(self, move: Tuple[str, Optional[int], Block]) \
+            -> Optional[int]:
+        # Moves that cannot be made, and combines that neither remove nor
+        # create target cells, leave every blob as it is.
+        action, _, block = move
+        if not isinstance(block, Block):
+            return None
+        target = colour_index(self.colour)
+        if action == 'pass' or \
+                (action == 'paint' and not _can_paint(block, target)):
+            return 0
+        if action == 'combine':
+            winner = block.combine_colour()
+            if winner is None:
+                return 0
+            if winner != target and \
+                    all(child.colour_index != target
+                        for child in block.children):
+                return 0
+        return None
+
+    def _score_grids(self, grids: numpy.ndarray) -> numpy.ndarray:
+        return _largest_blobs(grids == colour_index(self.colour))
 
     def _undiscovered_blob_size(self, pos: Tuple[int, int],
-                                board: List[List[Tuple[int, int, int]]],
+                                board: List[List[int]],
                                 visited: List[List[int]]) -> int:
         """Return the size of the largest connected blob that (a) is of this
         Goal's target colour, (b) includes the cell at <pos>, and (c) involves
@@ -190,7 +838,8 @@ class BlobGoal(Goal):
 
         If <pos> is out of bounds for <board>, return 0.
 
-        <board> is the flattened board on which to search for the blob.
+        <board> is the flattened board on which to search for the blob, with
+        each cell holding a palette index as produced by _flatten_indices.
         <visited> is a parallel structure that, in each cell, contains:
             -1 if this cell has never been visited
             0  if this cell has been visited and discovered
@@ -200,28 +849,28 @@ class BlobGoal(Goal):
 
         Update <visited> so that all cells that are visited are marked with
         either 0 or 1.
+
+        The search keeps its own stack of cells rather than recursing, so it
+        works for blobs of any size.
         """
-        x = pos[0]  # column
-        y = pos[1]  # row
-        # location out of bounds
-        if x < 0 or x >= len(board) or y < 0 or y >= len(board):
-            return 0
-        # location is visited
-        elif visited[x][y] == 0 or visited[x][y] == 1:
-            return 0
-        # location is not visited, checks if not right colour for goal
-        elif board[x][y] != self.colour:
-            visited[x][y] = 0
-            return 0
-        # location is still not visited, colour at pos is correct, now ask
-        # neighbors size
-        else:
+        target = colour_index(self.colour)
+        size = 0
+        stack = [pos]
+        while stack:
+            x, y = stack.pop()  # column, row
+            # location out of bounds, or already visited
+            if x < 0 or x >= len(board) or y < 0 or y >= len(board) or \
+                    visited[x][y] != -1:
+                continue
+            # location is not visited, checks if not right colour for goal
+            if board[x][y] != target:
+                visited[x][y] = 0
+                continue
+            # colour at pos is correct, now visit its neighbours
             visited[x][y] = 1
-            top = self._undiscovered_blob_size((x, y - 1), board, visited)
-            bottom = self._undiscovered_blob_size((x, y + 1), board, visited)
-            left = self._undiscovered_blob_size((x - 1, y), board, visited)
-            right = self._undiscovered_blob_size((x + 1, y), board, visited)
-            return 1 + top + bottom + left + right
+            size += 1
+            stack.extend([(x, y - 1), (x, y + 1), (x - 1, y), (x + 1, y)])
+        return size
 
     def description(self) -> str:
         return 'Make the largest \'blob\' (area) of' + colour_name(self.colour)
@@ -232,7 +881,7 @@ if __name__ == '__main__':
     python_ta.check_all(config={
         'allowed-import-modules': [
             'doctest', 'python_ta', 'random', 'typing', 'block', 'settings',
-            'math', '__future__'
+            'math', 'numpy', '__future__', 'collections', 'journal'
         ],
         'max-attributes': 15
     })
@@ -0,0 +1,138 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains the MoveJournal class, which applies moves to a board in
+place and remembers how to undo them. Searching with a journal means a
+candidate move can be applied, scored and undone without copying the board.
+"""
+from __future__ import annotations
+from typing import Any, List, Optional, Tuple
+import random
+
+from block import Block
+
+
+def apply_move(move: Tuple[str, Optional[int], Block],
+               colour: Tuple[int, int, int],
+               rng: Optional[random.Random] = None) -> bool:
+    """Perform <move> on its block, painting with <colour> if it is a paint,
+    and return True iff the move was performed.
+
+    <move> is a move tuple as produced by player._create_move. A smash makes
+    its random choices with <rng>, as in Block.smash.
+    """
+    action, direction, block = move
+    if action == 'rotate':
+        return block.rotate(direction)
+    elif action == 'swap':
+        return block.swap(direction)
+    elif action == 'smash':
+        return block.smash(rng)
+    elif action == 'paint':
+        return block.paint(colour)
+    elif action == 'combine':
+        return block.combine()
+    return action == 'pass'
+
+
+class MoveJournal:
+    """A stack of the moves that were applied to a board, recording enough to
+    undo each of them exactly.
+
+    Moves must be undone in the reverse order that they were applied, and the
+    board must not be changed by anything else in between.
+    """
+    # === Private Attributes ===
+    # _entries:
+    #   One tuple per applied move: the action name, the direction, the block
+    #   that was moved and whatever was overwritten by the move. That is the
+    #   old colour for a paint or a smash, the discarded children for a combine
+    #   and None for the other actions.
+    _entries: List[Tuple[str, Optional[int], Block, Any]]
+
+    def __init__(self) -> None:
+        """Initialize an empty journal.
+        """
+        self._entries = []
+
+    def __len__(self) -> int:
+        """Return the number of moves that can be undone.
+        """
+        return len(self._entries)
+
+    def apply(self, move: Tuple[str, Optional[int], Block],
+              colour: Tuple[int, int, int],
+              rng: Optional[random.Random] = None) -> bool:
+        """Perform <move>, painting with <colour> if it is a paint, and record
+        it so it can be undone. A smash makes its random choices with <rng>,
+        as in Block.smash.
+
+        Return True iff the move was performed. Nothing is recorded for a move
+        that could not be performed.
+        """
+        action, direction, block = move
+        if action in ('paint', 'smash'):
+            saved = block.colour
+        elif action == 'combine':
+            saved = block.children
+        else:
+            saved = None
+        if not apply_move(move, colour, rng):
+            return False
+        self._entries.append((action, direction, block, saved))
+        return True
+
+    def undo(self) -> None:
+        """Undo the most recently applied move that has not been undone yet.
+
+        Precondition: len(self) > 0
+        """
+        action, direction, block, saved = self._entries.pop()
+        if action == 'rotate':
+            block.rotate(4 - direction)
+        elif action == 'swap':
+            block.swap(direction)
+        elif action == 'paint':
+            block.colour = saved
+        elif action == 'smash':
+            block.children = []
+            block.colour = saved
+        elif action == 'combine':
+            block.children = saved
+            block.colour = None
+
+    def undo_to(self, length: int) -> None:
+        """Undo moves until only <length> of them are left in this journal.
+
+        Precondition: 0 <= length <= len(self)
+        """
+        while len(self._entries) > length:
+            self.undo()
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'typing', '__future__', 'block', 'random'
+        ]
+    })
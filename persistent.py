@@ -0,0 +1,291 @@
+"""CSC148 Assignment 2
+
+=== CSC148 Winter 2020 ===
+Department of Computer Science,
+University of Toronto
+
+This code is provided solely for the personal and private use of
+students taking the CSC148 course at the University of Toronto.
+Copying for purposes other than this use is expressly prohibited.
+All forms of distribution of this code, whether as given or with
+any changes, are expressly prohibited.
+
+Authors: Diane Horton, David Liu, Mario Badr, Sophia Huynh, Misha Schwartz,
+and Jaisie Sin
+
+All of the files in this directory and all subdirectories are:
+Copyright (c) Diane Horton, David Liu, Mario Badr, Sophia Huynh,
+Misha Schwartz, and Jaisie Sin
+
+=== Module Description ===
+
+This file contains the PersistentBlock class, an immutable version of Block.
+Moves on a PersistentBlock return a new board that shares every untouched
+subtree with the old one, so "copying" a board before trying a move is free.
+"""
+from __future__ import annotations
+from typing import Optional, Tuple, List
+import random
+import math
+
+from block import Block, _majority
+from settings import colour_index, index_colour, COLOUR_LIST, NO_COLOUR
+
+
+class PersistentBlock:
+    """An immutable square Block in the Blocky game.
+
+    A PersistentBlock has the same tree-related attributes as a Block, so it
+    can be flattened and scored like one, but it never changes once created.
+    It also has no position: a node can be shared by many boards, and its
+    position on the screen is only known once the path to it is known.
+
+    === Public Attributes ===
+    size:
+        The height and width of this square Block.
+    colour_index:
+        If this block is not subdivided, the index in settings.PALETTE of its
+        colour. Otherwise, NO_COLOUR. The colour itself is available as
+        <colour>, as for a Block.
+    level:
+        The level of this block within the overall block structure.
+    max_depth:
+        The deepest level allowed in the overall block structure.
+    children:
+        The blocks into which this block is subdivided, in the same order as
+        Block.children, or the empty tuple.
+
+    === Representation Invariants===
+    - The same as for Block, apart from those that concern positions.
+    """
+    __slots__ = ['size', 'colour_index', 'level', 'max_depth', 'children']
+    size: int
+    colour_index: int
+    level: int
+    max_depth: int
+    children: Tuple[PersistentBlock, ...]
+
+    def __init__(self, size: int, colour: int, level: int, max_depth: int,
+                 children: Tuple[PersistentBlock, ...] = ()) -> None:
+        """Initialize this block with dimensions <size> by <size>, the colour
+        with palette index <colour>, at <level>, and with the given
+        <children>.
+        """
+        self.size = size
+        self.colour_index = colour
+        self.level = level
+        self.max_depth = max_depth
+        self.children = children
+
+    @property
+    def colour(self) -> Optional[Tuple[int, int, int]]:
+        """The colour of this block if it is not subdivided, otherwise None.
+        """
+        return index_colour(self.colour_index)
+
+    @staticmethod
+    def from_block(block: Block) -> PersistentBlock:
+        """Return a PersistentBlock equivalent to <block>.
+        """
+        children = tuple(PersistentBlock.from_block(child)
+                         for child in block.children)
+        return PersistentBlock(block.size, block.colour_index, block.level,
+                               block.max_depth, children)
+
+    def to_block(self, position: Tuple[int, int] = (0, 0)) -> Block:
+        """Return a new Block equivalent to this block, with its upper left
+        corner at <position>.
+        """
+        block = Block(position, self.size, self.colour, self.level,
+                      self.max_depth)
+        positions = block._children_positions()
+        block.children = [self.children[i].to_block(positions[i])
+                          for i in range(len(self.children))]
+        return block
+
+    def __eq__(self, other: PersistentBlock) -> bool:
+        """Return True iff this block and all its descendants are equivalent to
+        <other> and all its descendants.
+        """
+        if self is other:
+            return True
+        return self.size == other.size and \
+            self.colour_index == other.colour_index and \
+            self.level == other.level and \
+            self.max_depth == other.max_depth and \
+            len(self.children) == len(other.children) and \
+            all(self.children[i] == other.children[i]
+                for i in range(len(self.children)))
+
+    def _child_size(self) -> int:
+        """Return the size of this Block's children.
+        """
+        return round(self.size / 2.0)
+
+    def path_to(self, location: Tuple[int, int], level: int,
+                position: Tuple[int, int] = (0, 0)) -> Optional[List[int]]:
+        """Return the child indices leading from this block to the block that
+        player._get_block would return for <location> and <level>, assuming
+        this block's upper left corner is at <position>.
+
+        Return None if this block does not include <location>.
+        """
+        x, y = location
+        x_o, y_o = position
+        if not (x_o <= x < x_o + self.size and y_o <= y < y_o + self.size):
+            return None
+        path = []
+        node = self
+        while node.level != level and node.children:
+            half = node._child_size()
+            right = x >= x_o + half
+            lower = y >= y_o + half
+            if lower:
+                y_o += half
+                i = 3 if right else 2
+            else:
+                i = 0 if right else 1
+            if right:
+                x_o += half
+            path.append(i)
+            node = node.children[i]
+        return path
+
+    def block_at(self, path: List[int]) -> PersistentBlock:
+        """Return the descendant of this block reached by following <path>.
+        """
+        node = self
+        for i in path:
+            node = node.children[i]
+        return node
+
+    def with_move(self, path: List[int], action: Tuple[str, Optional[int]],
+                  colour: Tuple[int, int, int]) -> Optional[PersistentBlock]:
+        """Return a new board in which <action> has been applied to the block
+        reached by following <path>, or None if the move is not valid.
+
+        Only the blocks along <path> are copied; every other subtree is shared
+        with this board. <colour> is used if the action is a paint.
+        """
+        node = self.block_at(path)
+        name, direction = action
+        if name == 'rotate':
+            new = node.rotated(direction)
+        elif name == 'swap':
+            new = node.swapped(direction)
+        elif name == 'smash':
+            new = node.smashed()
+        elif name == 'paint':
+            new = node.painted(colour)
+        elif name == 'combine':
+            new = node.combined()
+        else:
+            new = None
+        if new is None:
+            return None
+        return self._replaced(path, 0, new)
+
+    def _replaced(self, path: List[int], depth: int,
+                  new: PersistentBlock) -> PersistentBlock:
+        """Return a copy of this block in which the descendant reached by
+        following path[depth:] has been replaced with <new>.
+        """
+        if depth == len(path):
+            return new
+        i = path[depth]
+        children = list(self.children)
+        children[i] = children[i]._replaced(path, depth + 1, new)
+        return PersistentBlock(self.size, NO_COLOUR, self.level,
+                               self.max_depth, tuple(children))
+
+    def _with_children(self, children: Tuple[PersistentBlock, ...]) \
+            -> PersistentBlock:
+        """Return a block like this one but with the given <children>.
+        """
+        return PersistentBlock(self.size, NO_COLOUR, self.level,
+                               self.max_depth, children)
+
+    def rotated(self, direction: int) -> Optional[PersistentBlock]:
+        """Return this block rotated as described in Block.rotate, or None if
+        this block has no children.
+
+        Leaves look the same after a rotation, so they are shared.
+        """
+        if not self.children:
+            return None
+        c = self.children
+        if direction == 1:
+            order = (c[1], c[2], c[3], c[0])
+        else:
+            order = (c[3], c[0], c[1], c[2])
+        return self._with_children(tuple(child.rotated(direction) or child
+                                         for child in order))
+
+    def swapped(self, direction: int) -> Optional[PersistentBlock]:
+        """Return this block swapped as described in Block.swap, or None if
+        this block has no children.
+        """
+        if not self.children:
+            return None
+        c = self.children
+        if direction == 1:
+            return self._with_children((c[3], c[2], c[1], c[0]))
+        return self._with_children((c[1], c[0], c[3], c[2]))
+
+    def smashed(self) -> Optional[PersistentBlock]:
+        """Return this block smashed into four random children as described in
+        Block.smash, or None if this block cannot be smashed.
+        """
+        if self.level == self.max_depth or self.children:
+            return None
+        size = self._child_size()
+        level = self.level + 1
+        children = []
+        for _ in range(4):
+            child = PersistentBlock(size, NO_COLOUR, level, self.max_depth)
+            ran = random.random()
+            if ran < math.exp(-0.25 * self.level):
+                smashed = child.smashed()
+                if smashed is not None:
+                    children.append(smashed)
+                    continue
+            colour = colour_index(random.choice(COLOUR_LIST))
+            children.append(PersistentBlock(size, colour, level,
+                                            self.max_depth))
+        return self._with_children(tuple(children))
+
+    def painted(self, colour: Tuple[int, int, int]) \
+            -> Optional[PersistentBlock]:
+        """Return this block painted <colour> as described in Block.paint, or
+        None if the paint is not valid.
+        """
+        index = colour_index(colour)
+        if self.level == self.max_depth and self.colour_index != index and \
+                not self.children:
+            return PersistentBlock(self.size, index, self.level,
+                                   self.max_depth)
+        return None
+
+    def combined(self) -> Optional[PersistentBlock]:
+        """Return this block combined as described in Block.combine, or None if
+        the combine is not valid.
+        """
+        if self.level != self.max_depth - 1 or not self.children:
+            return None
+        winner = _majority([child.colour_index for child in self.children])
+        if winner is None:
+            return None
+        return PersistentBlock(self.size, winner, self.level, self.max_depth)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'allowed-import-modules': [
+            'doctest', 'python_ta', 'random', 'typing', '__future__', 'math',
+            'block', 'settings'
+        ],
+        'max-attributes': 15,
+        'max-args': 6
+    })
@@ -22,19 +22,27 @@ Misha Schwartz, and Jaisie Sin.
 This file contains the hierarchy of player classes.
 """
 from __future__ import annotations
-from typing import List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import math
 import random
+import time
 import pygame
 
-from block import Block
+from block import Block, new_epoch
 from goal import Goal, generate_goals
+from journal import MoveJournal
+from persistent import PersistentBlock
+from settings import colour_index, PALETTE
 
-from actions import KEY_ACTION, ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE, \
-    SWAP_HORIZONTAL, SWAP_VERTICAL, SMASH, PASS, PAINT, COMBINE
+from actions import KEY_ACTION, PASS, ROTATE_CLOCKWISE, \
+    ROTATE_COUNTER_CLOCKWISE, SWAP_HORIZONTAL, SWAP_VERTICAL, SMASH, COMBINE, \
+    PAINT, ACTION_PENALTY
 
 
-def create_players(num_human: int, num_random: int, smart_players: List[int]) \
-        -> List[Player]:
+def create_players(num_human: int, num_random: int, smart_players: List[int],
+                   num_alpha_beta: int = 0) -> List[Player]:
     """Return a new list of Player objects.
 
     <num_human> is the number of human player, <num_random> is the number of
@@ -45,19 +53,27 @@ def create_players(num_human: int, num_random: int, smart_players: List[int]) \
     <num_random> RandomPlayer objects, then the same number of SmartPlayer
     objects as the length of <smart_players>. The difficulty levels in
     <smart_players> should be applied to each SmartPlayer object, in order.
+
+    <num_alpha_beta> AlphaBetaPlayer objects come last. The players take turns
+    in the order of the list, so each one is given the goals of the players
+    after it, wrapping around to the start of the list, as its opponents.
     """
-    num_goals = num_human + num_random + len(smart_players)
+    mid = num_human + num_random
+    num_smart = mid + len(smart_players)
+    num_goals = num_smart + num_alpha_beta
     goals = generate_goals(num_goals)
     lst = []
-    mid = num_human + num_random
     for i in range(num_goals):
         if 0 <= i < num_human:
             lst.append(HumanPlayer(i, goals[i]))
         elif num_human <= i < mid:
             lst.append(RandomPlayer(i, goals[i]))
-        else:
+        elif mid <= i < num_smart:
             lst.append(SmartPlayer(i, goals[i], smart_players[i-num_human -
                                                               num_random]))
+        else:
+            lst.append(AlphaBetaPlayer(i, goals[i],
+                                       goals[i + 1:] + goals[:i]))
     return lst
 
 
@@ -83,15 +99,292 @@ def _get_block(block: Block, location: Tuple[int, int], level: int) -> \
     y = location[1]
     x_o = block.position[0]
     y_o = block.position[1]
-    x_m = x_o + block.size
-    y_m = y_o + block.size
-    if x_o <= x < x_m and y_o <= y < y_m:
-        if level == block.level or block.level == block.max_depth:
+    if not (x_o <= x < x_o + block.size and y_o <= y < y_o + block.size):
+        return None
+    # Each level is one quadrant (one Morton digit) of <location>, so go
+    # straight down to the child that holds it instead of trying all four.
+    while block.level != level and block.level != block.max_depth:
+        children = block.children
+        if not children:
             return block
-        for child in block.children:
-            if _get_block(child, location, level) is not None:
-                return _get_block(child, location, level)
-    return None
+        half = block._child_size()
+        right = x >= x_o + half
+        lower = y >= y_o + half
+        block = children[_QUADRANT_CHILD[(lower << 1) | right]]
+        x_o, y_o = block.position
+    return block
+
+
+# The index of the child in each quadrant, by (lower << 1) | right.
+_QUADRANT_CHILD = [1, 0, 2, 3]
+# The (right, lower) bits of each child index.
+_CHILD_QUADRANT = [(1, 0), (0, 0), (0, 1), (1, 1)]
+
+
+def _morton(cell: Tuple[int, int], bits: int) -> int:
+    """Return the Morton code of the unit cell <cell>, which is a (column,
+    row) pair of <bits> bits each.
+
+    Every two bits of a Morton code, starting from the most significant, pick
+    the quadrant that holds the cell one level further down.
+
+    >>> _morton((1, 0), 1)
+    1
+    >>> _morton((3, 2), 2)
+    13
+    """
+    code = 0
+    for bit in range(bits - 1, -1, -1):
+        code = (code << 2) | (((cell[1] >> bit) & 1) << 1) | \
+            ((cell[0] >> bit) & 1)
+    return code
+
+
+def _cell_path(board: Block, cell: Tuple[int, int], level: int) -> List[int]:
+    """Return the child indices leading from <board> to the block that holds
+    the unit cell <cell> at <level>, or to the leaf holding it if that leaf is
+    at a lower level.
+
+    <cell> is a (column, row) pair, counted in unit cells of size
+    2^max_depth by 2^max_depth. <board> can be a Block or any block-like tree,
+    such as a PersistentBlock.
+    """
+    path = []
+    block = board
+    shift = board.max_depth - board.level - 1
+    while block.level < level and block.children:
+        i = _QUADRANT_CHILD[(((cell[1] >> shift) & 1) << 1) |
+                            ((cell[0] >> shift) & 1)]
+        path.append(i)
+        block = block.children[i]
+        shift -= 1
+    return path
+
+
+def _random_cell(board: Block, rng: Optional[random.Random] = None) \
+        -> Tuple[Tuple[int, int], int]:
+    """Return a random unit cell (column, row) of <board>, and a random level
+    between 0 and the board's max_depth.
+
+    The choices are made with <rng>, or with the random module if <rng> is
+    None.
+    """
+    if rng is None:
+        rng = random
+    level = rng.randint(0, board.max_depth)
+    side = 2 ** board.max_depth
+    return (rng.randrange(side), rng.randrange(side)), level
+
+
+def _block_at_path(board: Block, path: List[int]) -> Block:
+    """Return the descendant of <board> reached by following the child indices
+    in <path>.
+    """
+    block = board
+    for i in path:
+        block = block.children[i]
+    return block
+
+
+class _BlockIndex:
+    """A precomputed table of the blocks of a board, by level and unit cell.
+
+    The table is only valid while the structure of the board is unchanged, or
+    has been restored (e.g. by undoing moves with a MoveJournal).
+    """
+    # === Private Attributes ===
+    # _max_depth:
+    #   The max_depth of the board.
+    # _levels:
+    #   _levels[k][m] is the block that _cell_path leads to for level k and the
+    #   cell whose Morton code at level k is m.
+    _max_depth: int
+    _levels: List[List[Optional[Block]]]
+
+    def __init__(self, board: Block) -> None:
+        """Build the index of <board>.
+
+        Precondition: <board> is the root of a board (board.level == 0).
+        """
+        self._max_depth = board.max_depth
+        self._levels = [[None] * (4 ** k) for k in range(board.max_depth + 1)]
+        self._add(board, 0)
+
+    def _add(self, block: Block, code: int) -> None:
+        """Record <block>, whose Morton code at its own level is <code>, and
+        its descendants.
+        """
+        children = block.children
+        if children:
+            self._levels[block.level][code] = block
+            for i in range(4):
+                right, lower = _CHILD_QUADRANT[i]
+                self._add(children[i], (code << 2) | (lower << 1) | right)
+        else:
+            # A leaf is also what every deeper level finds in its cells.
+            for k in range(block.level, self._max_depth + 1):
+                spread = 2 * (k - block.level)
+                table = self._levels[k]
+                for m in range(code << spread, (code + 1) << spread):
+                    table[m] = block
+
+    def lookup(self, cell: Tuple[int, int], level: int) -> Block:
+        """Return the block that holds the unit cell <cell> at <level>, or the
+        leaf that holds it if that leaf is at a lower level.
+        """
+        code = _morton(cell, self._max_depth) >> \
+            (2 * (self._max_depth - level))
+        return self._levels[level][code]
+
+
+class MoveIndex:
+    """The blocks of a board on which each action can currently be performed
+    by a player with a given goal, who paints with the goal's colour.
+
+    The index is brought up to date before every draw by looking again at the
+    blocks that changed since the last one, found with Block.changed_since, so
+    a valid move is drawn uniformly at random in O(1) time plus the time to
+    catch up with the moves made since the last draw.
+
+    === Public Attributes ===
+    board:
+        The board that is indexed.
+    """
+    # === Private Attributes ===
+    # _colour:
+    #   The palette index of the colour that this player paints with.
+    # _epoch:
+    #   The epoch that was started when this index was last brought up to
+    #   date.
+    # _blocks:
+    #   For each action other than PASS, the blocks on which it can be
+    #   performed, in no particular order.
+    # _where:
+    #   For each action, the position in _blocks[action] of each of its
+    #   blocks, by id() of the block.
+    # _records:
+    #   For each indexed block, by id(), the block itself, its children and
+    #   the actions it was indexed under when it was last looked at.
+    board: Block
+    _colour: int
+    _epoch: int
+    _blocks: Dict[Tuple[str, Optional[int]], List[Block]]
+    _where: Dict[Tuple[str, Optional[int]], Dict[int, int]]
+    _records: Dict[int, Tuple[Block, List[Block],
+                              List[Tuple[str, Optional[int]]]]]
+
+    def __init__(self, board: Block, goal: Goal) -> None:
+        """Index the moves on <board> for a player with <goal>.
+        """
+        self.board = board
+        self._colour = colour_index(goal.colour)
+        self._blocks = {}
+        self._where = {}
+        for action in KEY_ACTION.values():
+            if action != PASS:
+                self._blocks[action] = []
+                self._where[action] = {}
+        self._records = {}
+        # Hashing links every block to its parent, so that a move can mark
+        # the ancestors of the block it changed.
+        board.board_hash()
+        self._epoch = new_epoch()
+        self._catch_up(None)
+
+    def __len__(self) -> int:
+        """Return the number of valid moves on the board as it was when this
+        index was last brought up to date.
+        """
+        return sum(len(blocks) for blocks in self._blocks.values())
+
+    def sample(self) -> Optional[Tuple[str, Optional[int], Block]]:
+        """Return a valid move, other than PASS, chosen uniformly at random
+        from all the valid moves on the board, or None if there are none.
+        """
+        since = self._epoch
+        self._epoch = new_epoch()
+        self._catch_up(since)
+        total = len(self)
+        if total == 0:
+            return None
+        k = random.randrange(total)
+        for action in self._blocks:
+            if k < len(self._blocks[action]):
+                return _create_move(action, self._blocks[action][k])
+            k -= len(self._blocks[action])
+        return None
+
+    def _catch_up(self, since: Optional[int]) -> None:
+        """Look again at every block of the board that was created or changed
+        during or after the epoch <since>, or at every block if <since> is
+        None, and forget the blocks that are no longer on the board.
+        """
+        stack = [self.board]
+        while stack:
+            block = stack.pop()
+            record = self._records.get(id(block))
+            children = block.children
+            if record is not None:
+                for action in record[2]:
+                    self._remove(action, block)
+                for child in record[1]:
+                    if all(child is not kid for kid in children):
+                        self._forget(child)
+            actions = self._actions(block)
+            for action in actions:
+                self._add(action, block)
+            self._records[id(block)] = (block, list(children), actions)
+            for child in children:
+                if since is None or id(child) not in self._records or \
+                        child.changed_since(since):
+                    stack.append(child)
+
+    def _actions(self, block: Block) -> List[Tuple[str, Optional[int]]]:
+        """Return the actions, other than PASS, that can be performed on
+        <block>.
+        """
+        if block.children:
+            actions = [ROTATE_CLOCKWISE, ROTATE_COUNTER_CLOCKWISE,
+                       SWAP_HORIZONTAL, SWAP_VERTICAL]
+            if block.combine_colour() is not None:
+                actions.append(COMBINE)
+            return actions
+        elif block.level < block.max_depth:
+            return [SMASH]
+        elif block.colour_index != self._colour:
+            return [PAINT]
+        return []
+
+    def _forget(self, block: Block) -> None:
+        """Remove <block> and all the blocks that were indexed below it from
+        this index.
+        """
+        stack = [block]
+        while stack:
+            block = stack.pop()
+            record = self._records.pop(id(block), None)
+            if record is not None:
+                for action in record[2]:
+                    self._remove(action, block)
+                stack.extend(record[1])
+
+    def _add(self, action: Tuple[str, Optional[int]], block: Block) -> None:
+        """Record that <action> can be performed on <block>.
+        """
+        self._where[action][id(block)] = len(self._blocks[action])
+        self._blocks[action].append(block)
+
+    def _remove(self, action: Tuple[str, Optional[int]], block: Block) \
+            -> None:
+        """Record that <action> can no longer be performed on <block>, by
+        moving the last block for <action> into its place.
+        """
+        blocks = self._blocks[action]
+        i = self._where[action].pop(id(block))
+        last = blocks.pop()
+        if last is not block:
+            blocks[i] = last
+            self._where[action][id(last)] = i
 
 
 class Player:
@@ -139,12 +432,84 @@ class Player:
         """
         raise NotImplementedError
 
+    def close(self) -> None:
+        """Release anything this player holds on to between turns, once the
+        game is over.
+        """
+        return
+
 
 def _create_move(action: Tuple[str, Optional[int]], block: Block) -> \
         Tuple[str, Optional[int], Block]:
     return action[0], action[1], block
 
 
+def legal_moves(board: Block, goal: Goal) -> \
+        Iterator[Tuple[str, Optional[int], Block]]:
+    """Yield every move, other than PASS, that can be made on <board> by a
+    player with <goal>, who paints with the goal's colour.
+
+    Moves that would leave the board as it is are skipped: rotating a block
+    that looks the same once turned, or swapping a block whose swapped
+    children match each other. So is rotating counter-clockwise a block that
+    looks the same upside down, which would do the same as rotating it
+    clockwise.
+    """
+    target = colour_index(goal.colour)
+    stack = [board]
+    while stack:
+        block = stack.pop()
+        children = block.children
+        if children:
+            turned = block.board_hash(1)
+            if turned != block.board_hash():
+                yield _create_move(ROTATE_CLOCKWISE, block)
+                if block.board_hash(3) != turned:
+                    yield _create_move(ROTATE_COUNTER_CLOCKWISE, block)
+            hashes = [child.board_hash() for child in children]
+            if hashes[0] != hashes[1] or hashes[2] != hashes[3]:
+                yield _create_move(SWAP_HORIZONTAL, block)
+            if hashes[0] != hashes[3] or hashes[1] != hashes[2]:
+                yield _create_move(SWAP_VERTICAL, block)
+            if block.combine_colour() is not None:
+                yield _create_move(COMBINE, block)
+            stack.extend(children)
+        elif block.level < block.max_depth:
+            yield _create_move(SMASH, block)
+        elif block.colour_index != target:
+            yield _create_move(PAINT, block)
+
+
+class LegalMoves:
+    """The moves produced by legal_moves for a board and a goal, indexed so
+    that one of them can be drawn uniformly at random in O(1) time.
+
+    The index describes the board as it was when the index was made.
+    """
+    # === Private Attributes ===
+    # _moves:
+    #   The legal moves.
+    _moves: List[Tuple[str, Optional[int], Block]]
+
+    def __init__(self, board: Block, goal: Goal) -> None:
+        """Index the legal moves on <board> for a player with <goal>.
+        """
+        self._moves = list(legal_moves(board, goal))
+
+    def __len__(self) -> int:
+        """Return the number of legal moves.
+        """
+        return len(self._moves)
+
+    def sample(self) -> Optional[Tuple[str, Optional[int], Block]]:
+        """Return one of the legal moves, chosen uniformly at random, or None
+        if there are none.
+        """
+        if not self._moves:
+            return None
+        return self._moves[random.randrange(len(self._moves))]
+
+
 class HumanPlayer(Player):
     """A human player.
     """
@@ -220,11 +585,16 @@ class RandomPlayer(Player):
     # _proceed:
     #   True when the player should make a move, False when the player should
     #   wait.
+    # _moves:
+    #   The index of the valid moves on the board this player last moved on,
+    #   or None if it has not moved yet.
     _proceed: bool
+    _moves: Optional[MoveIndex]
 
     def __init__(self, player_id: int, goal: Goal) -> None:
         Player.__init__(self, player_id, goal)
         self._proceed = False
+        self._moves = None
 
     def get_selected_block(self, board: Block) -> Optional[Block]:
         return None
@@ -240,64 +610,105 @@ class RandomPlayer(Player):
         A valid move is a move other than PASS that can be successfully
         performed on the <board>.
 
-        This function does not mutate <board>.
+        This function does not mutate <board>. The move is drawn from a
+        MoveIndex of <board>, which is kept between turns and only catches up
+        with the blocks that changed, so no move has to be tried out. If
+        there is no valid move at all, this player passes.
         """
         if not self._proceed:
             return None  # Do not remove
 
-        action_list = list(KEY_ACTION.values())
-
-        while True:
-            copy_board = board.create_copy()
-
-            # choose a random level for block
-            level = random.choice(list(range(0, copy_board.max_depth + 1)))
-            # choose a random location
-            max1 = 2 ** copy_board.max_depth
-            unit_size = copy_board.size // max1
-            pos = (random.choice(list(range(0, max1))) * unit_size,
-                   random.choice(list(range(0, max1))) * unit_size)
-            block = _get_block(copy_board, pos, level)  # get a block at random
-            # position, and random level
-            if block is not None:
-                # choose a random action
-                action = random.choice(action_list)
-                # print(action)
-                boardy = _get_block(board, pos, level)
+        if self._moves is None or self._moves.board is not board:
+            self._moves = MoveIndex(board, self.goal)
+        move = self._moves.sample()
+        self._proceed = False  # Must set to False before returning!
+        if move is None:
+            return _create_move(PASS, board)
+        return move
 
-                if action == ROTATE_CLOCKWISE and block.rotate(1):
-                    self._proceed = False  # Must set to False before returning!
-                    return _create_move(action, boardy)
 
-                elif action == ROTATE_COUNTER_CLOCKWISE and block.rotate(3):
-                    self._proceed = False  # Must set to False before returning!
-                    return _create_move(action, boardy)
+# A candidate found by a search: the unit cell and level that pick its block,
+# and its action.
+_Candidate = Tuple[Tuple[int, int], int, Tuple[str, Optional[int]]]
 
-                elif action == SWAP_HORIZONTAL and block.swap(0):
-                    self._proceed = False  # Must set to False before returning!
-                    return _create_move(action, boardy)
 
-                elif action == SWAP_VERTICAL and block.swap(1):
-                    self._proceed = False  # Must set to False before returning!
-                    return _create_move(action, boardy)
+def _best_candidate(board: Block, goal: Goal, count: Optional[int],
+                    rng: Optional[random.Random] = None,
+                    deadline: Optional[float] = None) \
+        -> Tuple[int, Optional[_Candidate], int]:
+    """Try random moves other than PASS on <board> and return the best score
+    for <goal> that one of them reaches, that move, and the number of moves
+    that were tried.
 
-                elif action == SMASH and block.smash():
-                    self._proceed = False  # Must set to False before returning!
-                    return _create_move(action, boardy)
+    Stop after <count> moves, unless <count> is None, and once
+    time.perf_counter() has reached <deadline>, unless <deadline> is None. At
+    least one move is tried if either is given.
 
-                elif action == PAINT and block.paint(self.goal.colour):
-                    self._proceed = False  # Must set to False before returning!
-                    return _create_move(action, boardy)
+    Return a score of 0 and no move if none of the moves reaches a positive
+    score. Ties go to the move that was tried first. The random choices,
+    including those of the smashes that are tried, are made with <rng>, or
+    with the random module if <rng> is None.
 
-                elif action == COMBINE and block.combine():
-                    self._proceed = False  # Must set to False before returning!
-                    return _create_move(action, boardy)
+    <board> is left exactly as it was.
+    """
+    if rng is None:
+        rng = random
+    action_list = list(KEY_ACTION.values())
+    index = _BlockIndex(board)
+    current = goal.score(board)
+    best = None
+    max_score = 0
+    i = 0
+    while (count is None or i < count) and \
+            (deadline is None or i == 0 or time.perf_counter() < deadline):
+        # get a random block, at a random cell and random level
+        cell, level = _random_cell(board, rng)
+        block = index.lookup(cell, level)
+        # choose a random action
+        action = rng.choice(action_list)
+        if action != PASS:
+            i += 1
+            # A move that cannot be made changes nothing, so it is never
+            # better than the current score.
+            score = current + goal.score_delta(board,
+                                               _create_move(action, block),
+                                               rng)
+            if score > max_score:
+                max_score = score
+                best = (cell, level, action)
+    return max_score, best, i
+
+
+def _search_shard(board: PersistentBlock,
+                  palette: List[Tuple[int, int, int]], goal: Goal,
+                  count: Optional[int], seed: int,
+                  time_limit: Optional[float] = None) \
+        -> Tuple[int, Optional[_Candidate], int]:
+    """Return _best_candidate for <count> moves on <board>, with a generator
+    seeded with <seed>, and stopping after <time_limit> seconds unless it is
+    None.
+
+    This runs in a worker process. <palette> is settings.PALETTE in the
+    process that sent <board>, and is needed to read its colour indices.
+    """
+    for colour in palette:
+        colour_index(colour)
+    deadline = None
+    if time_limit is not None:
+        deadline = time.perf_counter() + time_limit
+    return _best_candidate(board.to_block(), goal, count,
+                           rng=random.Random(seed), deadline=deadline)
 
 
 class SmartPlayer(Player):
     """ A smart player who assesses _diff number of moves and makes the move
     that gives the best score. And if none of the moves increase the score,
-    then it decides to pass"""
+    then it decides to pass
+
+    === Public Attributes ===
+    evaluated:
+        The number of moves this player assessed on its last turn.
+    """
     # === Private Attributes ===
     # _proceed:
     #   True when the player should make a move, False when the player should
@@ -305,13 +716,43 @@ class SmartPlayer(Player):
     # _diff:
     #   The level of "smartness of the smart player, i.e. the number of moves
     #   it tries to do to find the max score out of them.
+    # _workers:
+    #   The number of worker processes that share the _diff moves, or 0 if
+    #   they are all tried in this process.
+    # _pool:
+    #   The worker processes, once they have been started.
+    # _time_limit:
+    #   The number of seconds the player spends assessing moves on each turn,
+    #   or None if it assesses _diff moves instead.
+    evaluated: int
     _proceed: bool
     _diff: int
-
-    def __init__(self, player_id: int, goal: Goal, difficulty: int) -> None:
+    _workers: int
+    _pool: Optional[ProcessPoolExecutor]
+    _time_limit: Optional[float]
+
+    def __init__(self, player_id: int, goal: Goal, difficulty: int,
+                 workers: int = 0, time_limit: Optional[float] = None) -> None:
+        """Initialize this SmartPlayer, which tries <difficulty> moves per
+        turn.
+
+        If <time_limit> is not None, the player instead keeps trying moves for
+        <time_limit> seconds per turn, and <difficulty> is ignored. It always
+        tries at least one move, so a turn can run over by the time it takes
+        to assess one move.
+
+        If <workers> is positive, the moves are shared out between that many
+        worker processes. This only pays off when <difficulty> is large, since
+        the board is sent to every worker on every turn. With a <time_limit>,
+        every worker spends the whole time trying moves.
+        """
         Player.__init__(self, player_id, goal)
         self._diff = difficulty
         self._proceed = False
+        self._workers = workers
+        self._pool = None
+        self._time_limit = time_limit
+        self.evaluated = 0
 
     def get_selected_block(self, board: Block) -> Optional[Block]:
         return None
@@ -320,6 +761,13 @@ class SmartPlayer(Player):
         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
             self._proceed = True
 
+    def close(self) -> None:
+        """Stop this player's worker processes, if it has started any.
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
     def generate_move(self, board: Block) ->\
             Optional[Tuple[str, Optional[int], Block]]:
         """Return a valid move by assessing multiple valid moves and choosing
@@ -330,70 +778,635 @@ class SmartPlayer(Player):
         performed on the <board>. If no move can be found that is better than
         the current score, this player will pass.
 
+        This function does not mutate <board>. Each candidate is scored with
+        Goal.score_delta, which works out most moves' effect without making
+        them, and otherwise applies the move in place, scores <board> and
+        undoes the move, which leaves <board> exactly as it was.
+        """
+        if not self._proceed:
+            return None  # Do not remove
+        start = time.perf_counter()
+        current = self.goal.score(board)
+        if self._workers > 0:
+            max_score, best, self.evaluated = \
+                self._parallel_search(board, start)
+        elif self._time_limit is not None:
+            max_score, best, self.evaluated = _best_candidate(
+                board, self.goal, None, deadline=start + self._time_limit)
+        else:
+            max_score, best, self.evaluated = _best_candidate(
+                board, self.goal, self._diff)
+
+        self._proceed = False  # Must set to False before returning!
+        if best is None or max_score <= current:
+            return _create_move(PASS, board)
+        cell, level, action = best
+        return _create_move(action, _block_at_path(
+            board, _cell_path(board, cell, level)))
+
+    def _parallel_search(self, board: Block, start: float) \
+            -> Tuple[int, Optional[_Candidate], int]:
+        """Return the best score and move found by sharing this player's _diff
+        moves on <board> between its worker processes, and the number of moves
+        that were tried.
+
+        <start> is the time.perf_counter() at which the turn started, so that
+        the workers only get what is left of the time limit.
+
+        The board is sent to each worker once. Each worker gets its own seed,
+        drawn from the random module, so a seeded game is reproducible, and
+        the shards' results are combined in order so that ties go to the same
+        move as they would in one process.
+        """
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self._workers)
+        frozen = PersistentBlock.from_block(board)
+        palette = PALETTE[:]
+        if self._time_limit is None:
+            shares = [self._diff // self._workers +
+                      (1 if i < self._diff % self._workers else 0)
+                      for i in range(self._workers)]
+            left = None
+        else:
+            shares = [None] * self._workers
+            left = self._time_limit - (time.perf_counter() - start)
+        futures = [self._pool.submit(_search_shard, frozen, palette,
+                                     self.goal, share, random.getrandbits(64),
+                                     left)
+                   for share in shares if share != 0]
+        max_score, best, evaluated = 0, None, 0
+        for future in futures:
+            score, candidate, tried = future.result()
+            evaluated += tried
+            if score > max_score:
+                max_score, best = score, candidate
+        return max_score, best, evaluated
+
+
+# A move in a search tree, which does not depend on the Block objects of any
+# one board: the child indices that lead from the root to the block, and the
+# action.
+_TreeMove = Tuple[Tuple[int, ...], Tuple[str, Optional[int]]]
+
+
+def _tree_moves(board: Block, goal: Goal) -> List[_TreeMove]:
+    """Return the moves produced by legal_moves for <board> and <goal>, as
+    search tree moves.
+    """
+    paths = {}
+    moves = []
+    for action, direction, block in legal_moves(board, goal):
+        if id(block) not in paths:
+            paths[id(block)] = tuple(block.path())
+        moves.append((paths[id(block)], (action, direction)))
+    return moves
+
+
+def _transform_move(move: _TreeMove, symmetry: Tuple[int, bool]) \
+        -> _TreeMove:
+    """Return the move that does to a board transformed by <symmetry> what
+    <move> does to the board itself.
+
+    <symmetry> is a number of clockwise quarter turns, and whether the board
+    is mirrored left to right before it is turned, as in Block.board_hash.
+
+    >>> _transform_move(((0, 2), ('swap', 0)), (1, False))
+    ((3, 1), ('swap', 1))
+    >>> _transform_move(((0, 2), ('rotate', 1)), (0, True))
+    ((1, 3), ('rotate', 3))
+    """
+    turns, mirrored = symmetry
+    flip = (1, 0, 3, 2) if mirrored else (0, 1, 2, 3)
+    path = tuple((flip[i] - turns) % 4 for i in move[0])
+    name, direction = move[1]
+    if name == 'rotate' and mirrored:
+        direction = 4 - direction
+    elif name == 'swap' and turns % 2 == 1:
+        direction = 1 - direction
+    return path, (name, direction)
+
+
+def _inverse_symmetry(symmetry: Tuple[int, bool]) -> Tuple[int, bool]:
+    """Return the symmetry that undoes <symmetry>, in the form used by
+    _transform_move.
+
+    >>> _inverse_symmetry((1, False))
+    (3, False)
+    >>> _inverse_symmetry((1, True))
+    (1, True)
+    """
+    turns, mirrored = symmetry
+    # A mirror image turned clockwise is undone by mirroring it again first.
+    return (turns if mirrored else -turns % 4), mirrored
+
+
+def _play_tree_move(board: Block, journal: MoveJournal, move: _TreeMove,
+                    colour: Tuple[int, int, int]) -> bool:
+    """Make <move> on <board> with <journal>, painting with <colour> if it is
+    a paint, and return True iff it was made.
+    """
+    path, action = move
+    block = board
+    for i in path:
+        if not block.children:
+            return False
+        block = block.children[i]
+    return journal.apply(_create_move(action, block), colour)
+
+
+class _SearchNode:
+    """A node of an MCTSPlayer's search tree. It stands for the board reached
+    from the root of the tree by the moves on the way to this node.
+
+    === Public Attributes ===
+    visits:
+        The number of rollouts that went through this node.
+    total:
+        The sum of the rewards of those rollouts.
+    cost:
+        The penalties for the moves from the root of the whole tree to this
+        node.
+    board:
+        The board_hash of the board this node stands for, or None if it is not
+        known.
+    children:
+        The nodes reached by the moves that have been tried from this node.
+    untried:
+        The legal moves that have not been tried from this node yet, or None
+        if they have not been listed yet.
+    """
+    visits: int
+    total: float
+    cost: int
+    board: Optional[int]
+    children: Dict[_TreeMove, _SearchNode]
+    untried: Optional[List[_TreeMove]]
+
+    def __init__(self, cost: int, board: Optional[int]) -> None:
+        """Initialize an unvisited node, which stands for the board with hash
+        <board> and is reached with penalties <cost>.
+        """
+        self.visits = 0
+        self.total = 0.0
+        self.cost = cost
+        self.board = board
+        self.children = {}
+        self.untried = None
+
+
+def _find_node(root: Optional[_SearchNode], board: int) \
+        -> Optional[_SearchNode]:
+    """Return the node closest to <root> in the tree below it, including
+    <root> itself, that stands for the board with hash <board>, or None if
+    there is none.
+    """
+    queue = deque([root] if root is not None else [])
+    while queue:
+        node = queue.popleft()
+        if node.board == board:
+            return node
+        queue.extend(node.children.values())
+    return None
+
+
+class MCTSPlayer(Player):
+    """A player that looks several of its own moves ahead with a Monte Carlo
+    tree search, and makes the first move of the most rewarding line of play.
+
+    The tree grows one node per iteration. Each iteration descends the tree
+    with the UCT rule, tries one new move, then plays a few random moves and
+    scores the board after each one. A rollout is rewarded with the best
+    score, less the penalties for its moves, that it reached along the way,
+    since a player can always stop by passing.
+
+    Moves are made in place with a MoveJournal and undone at the end of each
+    iteration. A smash has a random result, so the tree does not grow below
+    one; its value comes from rollouts only.
+
+    The subtree of the move that the player makes is kept for its next turn.
+    The other players' moves are moves that this player could have made too,
+    so if the board is then one that a node of the subtree stands for, the
+    search carries on from that node.
+    """
+    # === Private Attributes ===
+    # _proceed:
+    #   True when the player should make a move, False when the player should
+    #   wait.
+    # _iterations:
+    #   The number of iterations of the search on each turn.
+    # _depth:
+    #   The number of random moves in each rollout.
+    # _exploration:
+    #   The weight of the exploration term of the UCT rule.
+    # _root:
+    #   The subtree kept from the last turn, or None.
+    # _low, _high:
+    #   The lowest and highest rewards seen in the current tree, used to
+    #   scale rewards to between 0 and 1 for the UCT rule.
+    _proceed: bool
+    _iterations: int
+    _depth: int
+    _exploration: float
+    _root: Optional[_SearchNode]
+    _low: float
+    _high: float
+
+    def __init__(self, player_id: int, goal: Goal, iterations: int = 200,
+                 rollout_depth: int = 2, exploration: float = 1.4) -> None:
+        """Initialize this MCTSPlayer, which runs <iterations> iterations of
+        the search on each turn, with <rollout_depth> random moves in each
+        rollout, and weighs exploration in the UCT rule by <exploration>.
+        """
+        Player.__init__(self, player_id, goal)
+        self._proceed = False
+        self._iterations = iterations
+        self._depth = rollout_depth
+        self._exploration = exploration
+        self._root = None
+        self._low = 0.0
+        self._high = 0.0
+
+    def get_selected_block(self, board: Block) -> Optional[Block]:
+        return None
+
+    def process_event(self, event: pygame.event.Event) -> None:
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            self._proceed = True
+
+    def generate_move(self, board: Block) ->\
+            Optional[Tuple[str, Optional[int], Block]]:
+        """Return the move from the root of the search tree whose reward is
+        the highest that it can be trusted to be, by the UCT rule with the
+        exploration term subtracted rather than added. Return PASS if that
+        move's average reward does not beat the current score.
+
         This function does not mutate <board>.
         """
         if not self._proceed:
             return None  # Do not remove
-        action_list = list(KEY_ACTION.values())
-        max_scorer = None
-        max_score = 0
-        i = 0
-        while i < self._diff:
-            copy_board = board.create_copy()
-            # get a random level
-            level = random.choice(list(range(0, copy_board.max_depth + 1)))
-            max1 = 2 ** copy_board.max_depth
-            unit_size = copy_board.size // max1
-            pos = (random.choice(list(range(0, max1))) * unit_size,
-                   random.choice(list(range(0, max1))) * unit_size)
-            block = _get_block(copy_board, pos, level)  # get a block at random
-            # position, and random level
-            # choose a random action
-            action = random.choice(action_list)
-            if block is not None and action is not PASS:
-                boardy = _get_block(board, pos, level)
-                i += 1
-                if action == ROTATE_CLOCKWISE and block.rotate(1) and \
-                        self.goal.score(block) > max_score:
-                    max_score = self.goal.score(block)
-                    max_scorer = _create_move(action, boardy)
-
-                elif action == ROTATE_COUNTER_CLOCKWISE and block.rotate(3) and\
-                        self.goal.score(block) > max_score:
-                    max_score = self.goal.score(block)
-                    max_scorer = _create_move(action, boardy)
-
-                elif action == SWAP_HORIZONTAL and block.swap(0) and \
-                        self.goal.score(block) > max_score:
-                    max_score = self.goal.score(block)
-                    max_scorer = _create_move(action, boardy)
-
-                elif action == SWAP_VERTICAL and block.swap(1) and \
-                        self.goal.score(block) > max_score:
-                    max_score = self.goal.score(block)
-                    max_scorer = _create_move(action, boardy)
-
-                elif action == SMASH and block.smash() and \
-                        self.goal.score(block) > max_score:
-                    max_score = self.goal.score(block)
-                    max_scorer = _create_move(action, boardy)
-
-                elif action == PAINT and block.paint(self.goal.colour) and \
-                        self.goal.score(block) > max_score:
-                    max_score = self.goal.score(block)
-                    max_scorer = _create_move(action, boardy)
-
-                elif action == COMBINE and block.combine() and \
-                        self.goal.score(block) > max_score:
-                    max_score = self.goal.score(block)
-                    max_scorer = _create_move(action, boardy)
-
-        if max_score <= self.goal.score(board):
-            self._proceed = False  # Must set to False before returning!
+        board_hash = board.board_hash()
+        root = _find_node(self._root, board_hash)
+        if root is None:
+            root = _SearchNode(0, board_hash)
+            self._low = self._high = float(self.goal.score(board))
+        for _ in range(self._iterations):
+            self._iterate(board, root)
+
+        self._proceed = False  # Must set to False before returning!
+        self._root = root
+        if not root.children:
             return _create_move(PASS, board)
+        move, child = self._select(root, -self._exploration)
+        if child.total / child.visits + root.cost <= self.goal.score(board):
+            return _create_move(PASS, board)
+        self._root = child
+        path, action = move
+        return _create_move(action, _block_at_path(board, list(path)))
+
+    def _iterate(self, board: Block, root: _SearchNode) -> None:
+        """Run one iteration of the search on <board>, which <root> stands
+        for, and leave <board> as it was.
+        """
+        journal = MoveJournal()
+        node = root
+        line = [root]
+        # Selection: follow the UCT rule while every move has been tried.
+        while node.untried == [] and node.children:
+            move, child = self._select(node)
+            if not _play_tree_move(board, journal, move, self.goal.colour):
+                break
+            node = child
+            line.append(node)
+        # Expansion: try one new move, unless this node follows a smash.
+        if node.untried is None:
+            node.untried = []
+            if node.board is not None:
+                node.untried = _tree_moves(board, self.goal)
+                random.shuffle(node.untried)
+        if node.untried:
+            move = node.untried.pop()
+            if _play_tree_move(board, journal, move, self.goal.colour):
+                known = move[1] != SMASH
+                node = node.children.setdefault(move, _SearchNode(
+                    node.cost + ACTION_PENALTY[move[1]],
+                    board.board_hash() if known else None))
+                line.append(node)
+        # Rollout: play random moves and keep the best reward along the way.
+        cost = node.cost
+        reward = self.goal.score(board) - cost
+        for _ in range(self._depth):
+            cell, level = _random_cell(board)
+            action = random.choice(list(KEY_ACTION.values()))
+            block = _block_at_path(board, _cell_path(board, cell, level))
+            if action != PASS and \
+                    journal.apply(_create_move(action, block),
+                                  self.goal.colour):
+                cost += ACTION_PENALTY[action]
+                reward = max(reward, self.goal.score(board) - cost)
+        journal.undo_to(0)
+        # Backpropagation.
+        self._low = min(self._low, reward)
+        self._high = max(self._high, reward)
+        for node in line:
+            node.visits += 1
+            node.total += reward
+
+    def _select(self, node: _SearchNode, exploration: Optional[float] = None) \
+            -> Tuple[_TreeMove, _SearchNode]:
+        """Return the move from <node> with the highest UCT value, and the
+        node it leads to. The exploration term is weighed by <exploration>, or
+        by this player's own weight if <exploration> is None.
+        """
+        if exploration is None:
+            exploration = self._exploration
+        spread = self._high - self._low
+        log_visits = math.log(node.visits)
+        best = None
+        best_value = -math.inf
+        for move, child in node.children.items():
+            mean = child.total / child.visits
+            value = (mean - self._low) / spread if spread > 0 else 0.5
+            value += exploration * math.sqrt(log_visits / child.visits)
+            if value > best_value:
+                best, best_value = (move, child), value
+        return best
+
+
+# The kinds of value kept in a transposition table entry: the exact value of
+# the board, or a lower or upper bound on it.
+_EXACT = 0
+_LOWER = 1
+_UPPER = 2
+
+# Passing, as a search tree move.
+_PASS_MOVE = ((), PASS)
+
+
+class _TableEntry:
+    """What an AlphaBetaPlayer knows about one board, with one player to move.
+
+    === Public Attributes ===
+    depth:
+        The number of plies that <value> was searched to, or 0 if the board
+        has only been scanned.
+    value:
+        The value of the board to the searching player, searched to <depth>
+        plies.
+    flag:
+        Whether <value> is exact, or is a lower or an upper bound.
+    moves:
+        The moves to search from this board, best first for the player to
+        move. The order is that of the deepest search so far.
+    best:
+        The value, to the searching player, of the best move in a one ply
+        scan of this board, for the player to move.
+    """
+    depth: int
+    value: float
+    flag: int
+    moves: List[_TreeMove]
+    best: float
+
+    def __init__(self, moves: List[_TreeMove], best: float) -> None:
+        """Initialize an entry for a board that has been scanned, where <moves>
+        are the moves to search and <best> the value of the best one.
+        """
+        self.depth = 0
+        self.value = best
+        self.flag = _EXACT
+        self.moves = moves
+        self.best = best
+
+
+class AlphaBetaPlayer(Player):
+    """A player that searches a few turns ahead, including the turns of the
+    other players, and assumes that every other player moves to hurt it most.
+
+    This is a paranoid alpha-beta search with iterative deepening. The value
+    of a board is this player's goal score, less the penalties for this
+    player's moves from then on. The other players move in the order of
+    <opponents>, which should be the order in which they take their turns
+    after this player.
+
+    Every board that is searched is first scanned: each legal move is made,
+    the board scored and the move undone, and only the <breadth> best moves
+    for the player to move, and passing, are searched deeper. The scan and
+    the order from the last, shallower search are kept in a transposition
+    table keyed by canonical_hash and player to move, so each deeper search
+    tries the best moves first and prunes more. Moves in the table are kept
+    as they would be made on the board turned by its canonical_symmetry, so
+    that a board and its rotations and reflections share one entry.
+
+    Smashes have random results, so they are never searched.
+    """
+    # === Private Attributes ===
+    # _proceed:
+    #   True when the player should make a move, False when the player should
+    #   wait.
+    # _goals:
+    #   The goals of the players in the order they move, starting with this
+    #   player.
+    # _time_limit:
+    #   The number of seconds the player searches for on each turn.
+    # _plies:
+    #   The deepest search, in plies.
+    # _breadth:
+    #   The number of moves searched from each board.
+    # _table:
+    #   The transposition table, by canonical_hash and by the index in _goals
+    #   of the player to move.
+    # _capacity:
+    #   The number of entries the table can hold before it is emptied.
+    # _deadline:
+    #   The time.perf_counter() at which the current turn's search stops.
+    _proceed: bool
+    _goals: List[Goal]
+    _time_limit: float
+    _plies: int
+    _breadth: int
+    _table: Dict[Tuple[int, int], _TableEntry]
+    _capacity: int
+    _deadline: float
+
+    def __init__(self, player_id: int, goal: Goal, opponents: List[Goal],
+                 time_limit: float = 1.0, plies: int = 3, breadth: int = 4,
+                 capacity: int = 100000) -> None:
+        """Initialize this AlphaBetaPlayer, which searches for at most
+        <time_limit> seconds and <plies> plies on each turn, through the
+        <breadth> best moves of each board.
+
+        The table is emptied whenever it grows to more than <capacity>
+        entries.
+        """
+        Player.__init__(self, player_id, goal)
+        self._proceed = False
+        self._goals = [goal] + opponents
+        self._time_limit = time_limit
+        self._plies = plies
+        self._breadth = breadth
+        self._table = {}
+        self._capacity = capacity
+        self._deadline = 0.0
+
+    def get_selected_block(self, board: Block) -> Optional[Block]:
+        return None
+
+    def process_event(self, event: pygame.event.Event) -> None:
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            self._proceed = True
+
+    def generate_move(self, board: Block) ->\
+            Optional[Tuple[str, Optional[int], Block]]:
+        """Return the best move found by the deepest search that finished in
+        time, or PASS if no move beats passing.
+
+        A one ply search always finishes, even if it runs over the time
+        limit. This function does not mutate <board>.
+        """
+        if not self._proceed:
+            return None  # Do not remove
+        self._deadline = time.perf_counter() + self._time_limit
+        if len(self._table) > self._capacity:
+            self._table.clear()
+        move = _PASS_MOVE
+        for depth in range(1, self._plies + 1):
+            found = self._root_search(board, depth)
+            if found is None:
+                break
+            move = found
+
+        self._proceed = False  # Must set to False before returning!
+        path, action = move
+        return _create_move(action, _block_at_path(board, list(path)))
+
+    def _root_search(self, board: Block, depth: int) -> Optional[_TreeMove]:
+        """Return the best move on <board> found by a search <depth> plies
+        deep, or None if it ran out of time.
+        """
+        entry, back = self._scan(board, 0)
+        if depth == 1:
+            return _transform_move(entry.moves[0], back)
+        journal = MoveJournal()
+        alpha = -math.inf
+        best = _PASS_MOVE
+        values = {}
+        for move in entry.moves:
+            local = _transform_move(move, back)
+            if not _play_tree_move(board, journal, local, self.goal.colour):
+                continue
+            value = self._search(board, depth - 1, 1 % len(self._goals),
+                                 alpha, math.inf)
+            journal.undo()
+            if value is None:
+                return None
+            values[move] = value - ACTION_PENALTY[move[1]]
+            # Ties go to the earlier move, and passing comes first.
+            if values[move] > alpha:
+                alpha = values[move]
+                best = local
+        # Moves that could not be made keep their place after the others.
+        entry.moves.sort(key=lambda m: (m not in values, -values.get(m, 0)))
+        entry.depth, entry.value, entry.flag = depth, alpha, _EXACT
+        return best
+
+    def _search(self, board: Block, depth: int, turn: int, alpha: float,
+                beta: float) -> Optional[float]:
+        """Return the value of <board> searched <depth> plies deep, when the
+        player at index <turn> in _goals is to move, or None if the search
+        ran out of time.
+
+        The value is exact if it is strictly between <alpha> and <beta>.
+        Otherwise it is a bound on the exact value, which is then known to be
+        outside the window.
+        """
+        if depth == 0:
+            return float(self.goal.score(board))
+        if time.perf_counter() > self._deadline:
+            return None
+        entry, back = self._scan(board, turn)
+        if depth == 1:
+            return entry.best
+        if entry.depth >= depth:
+            if entry.flag == _EXACT:
+                return entry.value
+            elif entry.flag == _LOWER:
+                alpha = max(alpha, entry.value)
+            else:
+                beta = min(beta, entry.value)
+            if alpha >= beta:
+                return entry.value
+        low, high = alpha, beta
+        ours = turn == 0
+        journal = MoveJournal()
+        colour = self._goals[turn].colour
+        values = {}
+        result = -math.inf if ours else math.inf
+        for move in entry.moves:
+            if not _play_tree_move(board, journal,
+                                   _transform_move(move, back), colour):
+                continue
+            value = self._search(board, depth - 1, (turn + 1) % len(
+                self._goals), alpha, beta)
+            journal.undo()
+            if value is None:
+                return None
+            if ours:
+                value -= ACTION_PENALTY[move[1]]
+                result = max(result, value)
+                alpha = max(alpha, value)
+            else:
+                result = min(result, value)
+                beta = min(beta, value)
+            values[move] = value
+            if alpha >= beta:
+                break
+        # Moves that were pruned keep their place after the searched ones.
+        sign = -1 if ours else 1
+        entry.moves.sort(key=lambda m: (m not in values,
+                                        sign * values.get(m, 0)))
+        entry.depth, entry.value = depth, result
+        if result <= low:
+            entry.flag = _UPPER
+        elif result >= high:
+            entry.flag = _LOWER
         else:
-            self._proceed = False  # Must set to False before returning!
-            return max_scorer
+            entry.flag = _EXACT
+        return result
+
+    def _scan(self, board: Block, turn: int) \
+            -> Tuple[_TableEntry, Tuple[int, bool]]:
+        """Return the table entry for <board> with the player at index <turn>
+        in _goals to move, scanning the board if it has no entry yet, and the
+        symmetry that takes the entry's moves to moves on <board>.
+        """
+        symmetry = board.canonical_symmetry()
+        back = _inverse_symmetry(symmetry)
+        key = (board.board_hash(*symmetry), turn)
+        entry = self._table.get(key)
+        if entry is not None:
+            return entry, back
+        ours = turn == 0
+        goal = self._goals[turn]
+        journal = MoveJournal()
+        scanned = [(float(self.goal.score(board)), _PASS_MOVE)]
+        for move in _tree_moves(board, goal):
+            if move[1] != SMASH and \
+                    _play_tree_move(board, journal, move, goal.colour):
+                value = self.goal.score(board)
+                journal.undo()
+                if ours:
+                    value -= ACTION_PENALTY[move[1]]
+                scanned.append((float(value),
+                                _transform_move(move, symmetry)))
+        # Sorting is stable, so passing stays ahead of moves that are no
+        # better than it.
+        scanned.sort(key=lambda item: -item[0] if ours else item[0])
+        moves = [move for _, move in scanned[:self._breadth]]
+        if _PASS_MOVE not in moves:
+            moves.append(_PASS_MOVE)
+        entry = _TableEntry(moves, scanned[0][0])
+        self._table[key] = entry
+        return entry, back
 
 
 if __name__ == '__main__':
@@ -403,7 +1416,8 @@ if __name__ == '__main__':
         'allowed-io': ['process_event'],
         'allowed-import-modules': [
             'doctest', 'python_ta', 'random', 'typing', 'actions', 'block',
-            'goal', 'pygame', '__future__'
+            'goal', 'pygame', 'settings', '__future__', 'concurrent.futures',
+            'persistent', 'time', 'math', 'journal', 'collections'
         ],
         'max-attributes': 10,
         'generated-members': 'pygame.*'
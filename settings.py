@@ -21,7 +21,7 @@ Misha Schwartz, and Jaisie Sin.
 
 This file contains the global settings for the blocky game.
 """
-from typing import Tuple
+from typing import Optional, Tuple
 
 # Colours that we could use in the game
 WHITE = (255, 255, 255)
@@ -36,6 +36,17 @@ TEMPTING_TURQUOISE = (75, 196, 213)
 # A pallette of the colours we use in the game
 COLOUR_LIST = [PACIFIC_POINT, REAL_RED, OLD_OLIVE, DAFFODIL_DELIGHT]
 
+# Inside the game, colours are represented by their index in PALETTE, which
+# starts with COLOUR_LIST and grows if any other colour is used. RGB tuples are
+# only needed to draw the board.
+PALETTE = COLOUR_LIST[:]
+_PALETTE_INDEX = {PALETTE[i]: i for i in range(len(PALETTE))}
+# The colour index of a block that has no colour (because it has children).
+NO_COLOUR = -1
+
+# At most this many goal scores are remembered by goal.SCORE_CACHE.
+SCORE_CACHE_CAPACITY = 4096
+
 # The game board will be a square with this size.
 BOARD_SIZE = 750
 
@@ -76,3 +87,38 @@ def colour_name(colour: Tuple[int, int, int]) -> str:
         return colour_names[colour]
     else:
         return ''
+
+
+def colour_index(colour: Optional[Tuple[int, int, int]]) -> int:
+    """Return the index of <colour> in PALETTE, adding it to PALETTE if it is
+    not there yet. Return NO_COLOUR if <colour> is None.
+
+    >>> colour_index(PACIFIC_POINT)
+    0
+    >>> colour_index(DAFFODIL_DELIGHT)
+    3
+    >>> colour_index(None)
+    -1
+    """
+    if colour is None:
+        return NO_COLOUR
+    index = _PALETTE_INDEX.get(colour)
+    if index is None:
+        index = len(PALETTE)
+        PALETTE.append(colour)
+        _PALETTE_INDEX[colour] = index
+    return index
+
+
+def index_colour(index: int) -> Optional[Tuple[int, int, int]]:
+    """Return the colour with the given PALETTE <index>, or None if <index> is
+    NO_COLOUR.
+
+    >>> index_colour(1)
+    (199, 44, 58)
+    >>> index_colour(NO_COLOUR) is None
+    True
+    """
+    if index == NO_COLOUR:
+        return None
+    return PALETTE[index]
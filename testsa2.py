@@ -2,16 +2,28 @@ from __future__ import annotations
 
 from typing import List, Optional, Tuple
 import os
+import random
+import time
+import numpy
 import pygame
 import pytest
 
+from actions import KEY_ACTION, PAINT, SMASH
+from arena import BoardArena, generate_arena_board
 from block import Block, generate_board
-from blocky import _block_to_squares
-from goal import BlobGoal, PerimeterGoal, _flatten, generate_goals
+from blocky import GameData, GameOverState, _block_to_squares
+import goal
+from goal import BlobGoal, PerimeterGoal, _flatten, generate_goals, \
+    _flatten_indices, score_all
+from journal import MoveJournal
+from persistent import PersistentBlock
 from player import Player, HumanPlayer, SmartPlayer, \
-    RandomPlayer, _get_block, create_players
+    RandomPlayer, _get_block, create_players, _BlockIndex, _block_at_path, \
+    _cell_path, legal_moves, LegalMoves, MoveIndex, MCTSPlayer, \
+    AlphaBetaPlayer, _create_move
 from renderer import Renderer
-from settings import COLOUR_LIST
+import settings
+from settings import COLOUR_LIST, NO_COLOUR, PALETTE, colour_index
 
 # === TASK 2 ===
 
@@ -471,5 +483,956 @@ def test_generate_move_random_player() -> None:
                                       'paint', 'combine', 'smash']
 
 
+# === ARENA ===
+
+
+def test_arena_board_matches_block_board() -> None:
+    random.seed(148)
+    b = generate_board(4, 750)
+    random.seed(148)
+    a = generate_arena_board(4, 750)
+    assert a == b
+    assert _flatten(a) == _flatten(b)
+    assert set(_block_to_squares(a)) == set(_block_to_squares(b))
+
+
+def test_arena_moves_match_block_moves() -> None:
+    b = generate_board(3, 750)
+    a = BoardArena.from_block(b).root()
+    assert a == b
+    b.children[0].rotate(1)
+    a.children[0].rotate(1)
+    b.swap(1)
+    a.swap(1)
+    assert a == b
+    leaf = _get_block(b, (0, 0), 3)
+    if leaf.level == 3:
+        assert leaf.paint(COLOUR_LIST[0]) == \
+            _get_block(a, (0, 0), 3).paint(COLOUR_LIST[0])
+    assert a == b
+    assert a.arena.to_block() == b
+
+
+def test_arena_copy_is_independent() -> None:
+    a = BoardArena(750, 2, COLOUR_LIST[1]).root()
+    copy = a.create_copy()
+    assert copy == a
+    assert a.smash()
+    assert copy.children == []
+    assert len(a.children) == 4
+
+
+def test_arena_combine_reuses_nodes() -> None:
+    a = BoardArena(500, 1).root()
+    assert a.smash()
+    for child in a.children:
+        child.colour = COLOUR_LIST[2]
+    a.children[3].colour = COLOUR_LIST[0]
+    size = len(a.arena)
+    assert a.combine()
+    assert a.colour == COLOUR_LIST[2]
+    assert a.smash()
+    assert len(a.arena) == size
+
+
+# === PERSISTENT ===
+
+
+def test_persistent_move_shares_untouched_subtrees() -> None:
+    b = Block((0, 0), 750, COLOUR_LIST[0], 0, 2)
+    b.smash()
+    b.children[1].smash()
+    p = PersistentBlock.from_block(b)
+    assert p.to_block() == b
+    path = p.path_to((0, 0), 1)
+    assert path == [1]
+    moved = p.with_move(path, ('swap', 0), COLOUR_LIST[0])
+    assert moved.children[0] is p.children[0]
+    assert moved.children[2] is p.children[2]
+    assert p.to_block() == b
+    b.children[1].swap(0)
+    assert moved.to_block() == b
+
+
+def test_persistent_rotate_matches_block() -> None:
+    b = generate_board(4, 750)
+    p = PersistentBlock.from_block(b)
+    rotated = p.with_move([], ('rotate', 3), COLOUR_LIST[0])
+    b.rotate(3)
+    assert rotated.to_block() == b
+    assert PerimeterGoal(COLOUR_LIST[1]).score(rotated) == \
+        PerimeterGoal(COLOUR_LIST[1]).score(b)
+
+
+def test_generate_move_smart_player_does_not_mutate() -> None:
+    b = generate_board(3, 750)
+    copy = b.create_copy()
+    P = SmartPlayer(0, BlobGoal(COLOUR_LIST[0]), 20)
+    P._proceed = True
+    move = P.generate_move(b)
+    assert b == copy
+    assert move[0] in ['swap', 'rotate', 'paint', 'combine', 'smash', 'pass']
+
+
+# === JOURNAL ===
+
+
+def test_journal_undo_restores_board() -> None:
+    b = generate_board(4, 750)
+    copy = b.create_copy()
+    journal = MoveJournal()
+    journal.apply(('rotate', 1, b), COLOUR_LIST[0])
+    journal.apply(('swap', 0, b.children[2]), COLOUR_LIST[0])
+    for leaf in [_get_block(b, (0, 0), 4), _get_block(b, (700, 700), 4)]:
+        if leaf is not None:
+            journal.apply(('smash', None, leaf), COLOUR_LIST[0])
+            journal.apply(('paint', None, leaf), COLOUR_LIST[1])
+    journal.apply(('rotate', 3, b.children[0]), COLOUR_LIST[0])
+    journal.undo_to(0)
+    assert len(journal) == 0
+    assert b == copy
+
+
+def test_journal_undo_combine_restores_children() -> None:
+    d = Block((0, 0), 500, None, 0, 1)
+    d.children = [Block(d._children_positions()[0], 250, COLOUR_LIST[1], 1, 1),
+                  Block(d._children_positions()[1], 250, COLOUR_LIST[1], 1, 1),
+                  Block(d._children_positions()[2], 250, COLOUR_LIST[1], 1, 1),
+                  Block(d._children_positions()[3], 250, COLOUR_LIST[3], 1, 1)]
+    kids = d.children
+    journal = MoveJournal()
+    assert journal.apply(('combine', None, d), COLOUR_LIST[0])
+    assert not journal.apply(('combine', None, d), COLOUR_LIST[0])
+    assert len(journal) == 1
+    journal.undo()
+    assert d.colour is None
+    assert d.children == kids
+    assert d.children[3] is kids[3]
+
+
+# === LAZY ROTATION ===
+
+
+def test_rotate_is_deferred_until_children_are_read() -> None:
+    b = generate_board(4, 750)
+    copy = b.create_copy()
+    for _ in range(4):
+        assert b.rotate(1)
+    assert b._pending == 0
+    assert b == copy
+    assert b._pending is None
+
+
+def test_swap_held_block_below_pending_rotate() -> None:
+    b = generate_board(4, 750)
+    copy = b.create_copy()
+    child = b.children[0]
+    b.rotate(1)
+    child.swap(0)
+    copy.rotate(1)
+    copy.children[3].swap(0)
+    assert b == copy
+
+
+# === DERIVED POSITIONS ===
+
+
+def test_swap_refreshes_positions_on_traversal() -> None:
+    b = generate_board(4, 750)
+    copy = b.create_copy()
+    assert b.swap(1) == copy.swap(1)
+    assert b._pending in (None, 0)
+    squares = {(pos, size) for _, pos, size in _block_to_squares(b)}
+    assert squares == {(pos, size) for _, pos, size in
+                       _block_to_squares(copy)}
+    block = b
+    while block.children:
+        positions = block._children_positions()
+        for i in range(4):
+            assert block.children[i].position == positions[i]
+        block = block.children[1]
+
+
+# === BOARD HASH ===
+
+
+def test_board_hash_equal_boards() -> None:
+    b = generate_board(4, 750)
+    copy = PersistentBlock.from_block(b).to_block()
+    assert b.board_hash() == copy.board_hash()
+    b.rotate(1)
+    b.rotate(1)
+    copy.rotate(3)
+    copy.rotate(3)
+    assert b.board_hash() == copy.board_hash()
+    assert b == copy
+
+
+def test_board_hash_follows_moves() -> None:
+    b = Block((0, 0), 750, None, 0, 1)
+    set_children(b, [COLOUR_LIST[0], COLOUR_LIST[1], COLOUR_LIST[1],
+                     COLOUR_LIST[2]])
+    before = b.board_hash()
+    assert b.rotate(1)
+    rotated = b.board_hash()
+    assert rotated != before
+    b.children[0].colour = COLOUR_LIST[3]
+    assert b.board_hash() != rotated
+    b.children[0].colour = COLOUR_LIST[1]
+    assert b.board_hash() == rotated
+    assert b.rotate(3)
+    assert b.board_hash() == before
+    assert b.combine()
+    assert b.board_hash() == Block((0, 0), 750, COLOUR_LIST[1], 0,
+                                   1).board_hash()
+
+
+# === SPATIAL LOOKUP ===
+
+
+def test_get_block_returns_deepest_block() -> None:
+    b = Block((0, 0), 750, None, 0, 2)
+    set_children(b, [None, COLOUR_LIST[2], COLOUR_LIST[1], COLOUR_LIST[3]])
+    assert _get_block(b, (10, 10), 2) is b.children[1]
+    assert _get_block(b, (750, 10), 0) is None
+
+
+def test_cell_lookup_matches_get_block() -> None:
+    b = generate_board(5, 750)
+    index = _BlockIndex(b)
+    unit = 750 / 32
+    for col in range(32):
+        for row in range(0, 32, 3):
+            for level in range(6):
+                block = _block_at_path(b, _cell_path(b, (col, row), level))
+                assert index.lookup((col, row), level) is block
+                centre = (int((col + 0.5) * unit), int((row + 0.5) * unit))
+                assert _get_block(b, centre, level) is block
+
+
+# === PALETTE ===
+
+
+def test_blocks_store_palette_indices() -> None:
+    b = Block((0, 0), 500, COLOUR_LIST[2], 0, 1)
+    assert b.colour_index == 2
+    assert b.colour == COLOUR_LIST[2]
+    b.smash()
+    assert b.colour_index == NO_COLOUR
+    for child in b.children:
+        assert child.colour == PALETTE[child.colour_index]
+
+
+def test_flatten_indices_matches_flatten() -> None:
+    b = generate_board(3, 750)
+    flat = _flatten(b)
+    indices = _flatten_indices(b)
+    assert [[PALETTE[i] for i in column] for column in indices] == flat
+
+
+def test_unknown_colour_is_added_to_palette(monkeypatch) -> None:
+    # Work on copies, so that pink is not left in the palette for later tests.
+    monkeypatch.setattr(settings, 'PALETTE', settings.PALETTE[:])
+    monkeypatch.setattr(settings, '_PALETTE_INDEX',
+                        dict(settings._PALETTE_INDEX))
+    pink = (255, 192, 203)
+    b = Block((0, 0), 500, pink, 0, 0)
+    assert settings.PALETTE[b.colour_index] == pink
+    assert BlobGoal(pink).score(b) == 1
+
+
+def test_arena_holds_large_palette_indices(monkeypatch) -> None:
+    monkeypatch.setattr(settings, 'PALETTE', settings.PALETTE[:])
+    monkeypatch.setattr(settings, '_PALETTE_INDEX',
+                        dict(settings._PALETTE_INDEX))
+    colours = [(i, 0, 1) for i in range(200)]
+    for colour in colours:
+        colour_index(colour)
+    arena = BoardArena(750, 1, colours[-1])
+    assert arena.root().colour == colours[-1]
+
+
+# === NUMPY FLATTEN ===
+
+
+def test_flatten_grid_matches_list_engine() -> None:
+    b = generate_board(5, 750)
+    grid = goal._flatten_grid(b)
+    assert grid.dtype == numpy.int16
+    assert grid.shape == (32, 32)
+    assert grid.tolist() == goal._flatten_lists(b)
+
+
+def test_flatten_colourless_leaf() -> None:
+    b = Block((0, 0), 750, None, 0, 1)
+    b.children = [Block(b._children_positions()[i], 375,
+                        None if i == 0 else COLOUR_LIST[0], 1, 1)
+                  for i in range(4)]
+    assert _flatten(b) == [[COLOUR_LIST[0], COLOUR_LIST[0]],
+                           [None, COLOUR_LIST[0]]]
+    assert goal._flatten_grid(b).tolist() == goal._flatten_lists(b)
+    assert PerimeterGoal(COLOUR_LIST[0]).score(b) == 6
+    assert PerimeterGoal(COLOUR_LIST[0]).score(
+        PersistentBlock.from_block(b)) == 6
+
+
+def test_goals_score_without_numpy(monkeypatch) -> None:
+    b = generate_board(4, 750)
+    scores = [PerimeterGoal(c).score(b) for c in COLOUR_LIST] + \
+             [BlobGoal(c).score(b) for c in COLOUR_LIST]
+    flat = _flatten(b)
+    monkeypatch.setattr(goal, 'numpy', None)
+    assert _flatten(b) == flat
+    assert [PerimeterGoal(c).score(b) for c in COLOUR_LIST] + \
+           [BlobGoal(c).score(b) for c in COLOUR_LIST] == scores
+
+
+# === CACHED GRID ===
+
+
+def test_cached_grid_follows_moves() -> None:
+    b = generate_board(4, 750)
+    grid = goal._flatten_grid(b)
+    b.children[1].rotate(1)
+    b.children[2].swap(0)
+    leaf = b
+    while leaf.children:
+        leaf = leaf.children[3]
+    leaf.colour = COLOUR_LIST[(COLOUR_LIST.index(leaf.colour) + 1) % 4]
+    assert goal._flatten_grid(b) is grid
+    assert grid.tolist() == goal._flatten_lists(b)
+
+
+def test_cached_grid_only_redraws_dirty_blocks() -> None:
+    b = Block((0, 0), 750, None, 0, 1)
+    b.children = [Block((0, 0), 375, COLOUR_LIST[i], 1, 1) for i in range(4)]
+    grid = goal._flatten_grid(b)
+    # Scribble on the cached cell of child 1; only child 0 is then repainted.
+    grid[0, 0] = 3
+    b.children[0].colour = COLOUR_LIST[3]
+    assert goal._flatten_grid(b).tolist() == [[3, 2], [3, 3]]
+
+
+# === UNION-FIND BLOBS ===
+
+
+def test_blob_goal_deep_board_without_recursion() -> None:
+    b = Block((0, 0), 750, COLOUR_LIST[0], 0, 8)
+    assert BlobGoal(COLOUR_LIST[0]).score(b) == 256 * 256
+    assert BlobGoal(COLOUR_LIST[1]).score(b) == 0
+
+
+def test_blob_goal_joins_runs_across_columns(monkeypatch) -> None:
+    # A U shape: the two arms only meet through the bottom row.
+    b = Block((0, 0), 750, None, 0, 2)
+    b.children = [Block((0, 0), 375, COLOUR_LIST[1], 1, 2) for _ in range(4)]
+    for i in (2, 3):
+        b.children[i].smash()
+        for j in range(4):
+            b.children[i].children[j].colour = COLOUR_LIST[0]
+    b.children[2].children[0].colour = COLOUR_LIST[1]
+    b.children[3].children[1].colour = COLOUR_LIST[1]
+    for engine in (goal.numpy, None):
+        monkeypatch.setattr(goal, 'numpy', engine)
+        assert BlobGoal(COLOUR_LIST[0]).score(b) == 6
+        assert BlobGoal(COLOUR_LIST[1]).score(b) == 10
+
+
+def test_undiscovered_blob_size_is_iterative() -> None:
+    side = 200
+    board = [[0] * side for _ in range(side)]
+    visited = [[-1] * side for _ in range(side)]
+    size = BlobGoal(COLOUR_LIST[0])._undiscovered_blob_size((0, 0), board,
+                                                             visited)
+    assert size == side * side
+
+
+# === LEAF BLOBS ===
+
+
+def _cell_blob_score(goal_: BlobGoal, board: Block) -> int:
+    flat = _flatten_indices(board)
+    visited = [[-1] * len(flat) for _ in flat]
+    return max(goal_._undiscovered_blob_size((i, j), flat, visited)
+               for i in range(len(flat)) for j in range(len(flat)))
+
+
+def test_leaf_blobs_match_cell_blobs() -> None:
+    random.seed(148)
+    for depth in range(1, 6):
+        b = generate_board(depth, 750)
+        for colour in COLOUR_LIST:
+            assert BlobGoal(colour).score(b) == \
+                _cell_blob_score(BlobGoal(colour), b)
+
+
+def test_column_runs_match_cell_blobs(monkeypatch) -> None:
+    random.seed(11)
+    boards = [generate_board(depth, 750) for depth in range(1, 6)]
+    for use_numpy in (True, False):
+        if not use_numpy:
+            monkeypatch.setattr(goal, 'numpy', None)
+        for b in boards:
+            for colour in COLOUR_LIST:
+                runs = goal._target_runs(b, colour_index(colour))
+                assert goal._largest_blob(runs) == \
+                    _cell_blob_score(BlobGoal(colour), b)
+    for b in boards:
+        assert [BlobGoal(c).score(PersistentBlock.from_block(b))
+                for c in COLOUR_LIST] == \
+            [BlobGoal(c).score(b) for c in COLOUR_LIST]
+
+
+def test_leaf_blobs_join_leaf_to_smaller_neighbours() -> None:
+    # The big upper-left leaf touches only two of the four cells of the
+    # upper-right block, one along its edge and one of another colour.
+    b = Block((0, 0), 750, None, 0, 2)
+    b.children = [Block((0, 0), 375, COLOUR_LIST[0], 1, 2) for _ in range(4)]
+    b.children[0].smash()
+    for i in range(4):
+        b.children[0].children[i].colour = COLOUR_LIST[1]
+    b.children[0].children[2].colour = COLOUR_LIST[0]
+    b.children[3].colour = COLOUR_LIST[1]
+    assert BlobGoal(COLOUR_LIST[0]).score(b) == 9
+    assert BlobGoal(COLOUR_LIST[1]).score(b) == 7
+
+
+def test_leaf_blobs_score_arena_views_like_blocks() -> None:
+    random.seed(148)
+    for _ in range(5):
+        b = generate_board(4, 750)
+        root = BoardArena.from_block(b).root()
+        goals = [BlobGoal(colour) for colour in COLOUR_LIST]
+        assert [g.score(root) for g in goals] == [g.score(b) for g in goals]
+        assert score_all(root, goals) == score_all(b, goals)
+
+
+# === BLOB SUMMARIES ===
+
+
+def test_blob_size_follows_moves() -> None:
+    random.seed(13)
+    b = generate_board(4, 750)
+    journal = MoveJournal()
+    for _ in range(30):
+        block = b
+        while block.children and random.random() < 0.7:
+            block = random.choice(block.children)
+        action = random.choice([('rotate', 1), ('swap', 0), ('smash', None),
+                                ('paint', None), ('combine', None)])
+        journal.apply((action[0], action[1], block),
+                      random.choice(COLOUR_LIST))
+        persistent = PersistentBlock.from_block(b)
+        for colour in COLOUR_LIST:
+            assert BlobGoal(colour).score(b) == \
+                BlobGoal(colour).score(persistent)
+
+
+def test_blob_summary_only_recomputed_on_path() -> None:
+    b = generate_board(3, 750)
+    BlobGoal(COLOUR_LIST[0]).score(b)
+    leaf = b
+    while leaf.children:
+        leaf = leaf.children[0]
+    leaf.colour = COLOUR_LIST[1] if leaf.colour == COLOUR_LIST[0] \
+        else COLOUR_LIST[0]
+    assert b._blobs is None and leaf._blobs is None
+    assert b.children[1]._blobs is not None
+
+
+# === BORDER COUNTS ===
+
+
+def test_border_count_matches_flattened_board() -> None:
+    random.seed(14)
+    b = generate_board(4, 750)
+    b.children[0].rotate(1)
+    b.children[2].swap(1)
+    persistent = PersistentBlock.from_block(b)
+    for colour in COLOUR_LIST:
+        assert PerimeterGoal(colour).score(b) == \
+            PerimeterGoal(colour).score(persistent)
+
+
+def test_border_count_skips_inner_blocks() -> None:
+    b = Block((0, 0), 750, None, 0, 2)
+    b.children = [Block((0, 0), 375, COLOUR_LIST[0], 1, 2) for _ in range(4)]
+    b.children[1].smash()
+    for child in b.children[1].children:
+        child.colour = COLOUR_LIST[0]
+    assert b.border_counts()[colour_index(COLOUR_LIST[0])] == 16
+    # The lower-right cell of the upper-left block is not on the border.
+    assert b.children[1].children[3]._borders is None
+    b.children[1].children[3].colour = COLOUR_LIST[1]
+    assert b.border_counts()[colour_index(COLOUR_LIST[0])] == 16
+
+
+# === SCORE ALL ===
+
+
+def test_score_all_matches_each_goal(monkeypatch) -> None:
+    random.seed(15)
+    b = generate_board(4, 750)
+    goals = [PerimeterGoal(c) for c in COLOUR_LIST] + \
+        [BlobGoal(c) for c in COLOUR_LIST] + [BlobGoal(COLOUR_LIST[0])]
+    expected = [g.score(b) for g in goals]
+    assert score_all(b, goals) == expected
+    assert score_all(PersistentBlock.from_block(b), goals) == expected
+    monkeypatch.setattr(goal, 'numpy', None)
+    assert score_all(PersistentBlock.from_block(b), goals) == expected
+
+
+def test_game_data_calculate_scores() -> None:
+    b = generate_board(3, 750)
+    players = create_players(0, 3, [])
+    data = GameData(b, players)
+    data.smashes[1] = 2
+    assert data.calculate_scores() == \
+        [data.calculate_score(p.id) for p in players]
+
+
+# === SCORE CACHE ===
+
+
+def test_score_cache_evicts_least_recently_used() -> None:
+    cache = goal.ScoreCache(2)
+    cache.put((1, BlobGoal, 0), 10)
+    cache.put((2, BlobGoal, 0), 20)
+    assert cache.get((1, BlobGoal, 0)) == 10
+    cache.put((3, BlobGoal, 0), 30)
+    assert cache.get((2, BlobGoal, 0)) is None
+    assert cache.get((1, BlobGoal, 0)) == 10
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_score_cache_shared_by_goal_score(monkeypatch) -> None:
+    monkeypatch.setattr(goal, 'SCORE_CACHE', goal.ScoreCache(16))
+    b = generate_board(3, 750)
+    blob = BlobGoal(COLOUR_LIST[0])
+    score = blob.score(b)
+    assert (goal.SCORE_CACHE.hits, goal.SCORE_CACHE.misses) == (0, 1)
+    # An equal board has the same hash, so its score is found in the cache.
+    assert blob.score(b.create_copy()) == score
+    assert goal.SCORE_CACHE.hits == 1
+    assert score_all(b, [blob, PerimeterGoal(COLOUR_LIST[0])])[0] == score
+    assert goal.SCORE_CACHE.hits == 2
+    leaf = b
+    while leaf.children:
+        leaf = leaf.children[0]
+    leaf.colour = COLOUR_LIST[1] if leaf.colour == COLOUR_LIST[0] \
+        else COLOUR_LIST[0]
+    blob.score(b)
+    assert goal.SCORE_CACHE.misses == 3
+
+
+# === BATCH SCORING ===
+
+
+def test_score_batch_matches_score(monkeypatch) -> None:
+    monkeypatch.setattr(goal, 'SCORE_CACHE', goal.ScoreCache(0))
+    random.seed(17)
+    boards = [generate_board(random.randint(1, 5), 750) for _ in range(12)]
+    for colour in COLOUR_LIST:
+        for g in (BlobGoal(colour), PerimeterGoal(colour)):
+            assert g.score_batch(boards) == [g.score(b) for b in boards]
+
+
+def test_largest_blobs_labels_winding_blob() -> None:
+    # Every other column is filled, joined alternately at the top and bottom.
+    masks = numpy.zeros((2, 8, 8), dtype=bool)
+    masks[0, ::2] = True
+    for i in range(1, 7, 2):
+        masks[0, i, 0 if i % 4 == 1 else -1] = True
+    masks[1, 3, 3] = True
+    assert goal._largest_blobs(masks).tolist() == [35, 1]
+
+
+# === SCORE DELTA ===
+
+
+def test_score_delta_matches_applying_moves() -> None:
+    random.seed(18)
+    b = generate_board(3, 750)
+    blocks = [b]
+    for block in blocks:
+        blocks.extend(block.children)
+    for block in blocks:
+        for action in KEY_ACTION.values():
+            move = (action[0], action[1], block)
+            for g in (PerimeterGoal(COLOUR_LIST[0]), BlobGoal(COLOUR_LIST[1])):
+                copy = b.create_copy()
+                delta = g.score_delta(b, move)
+                before = g.score(b)
+                journal = MoveJournal()
+                if action[0] != 'smash' and journal.apply(move, g.colour):
+                    assert delta == g.score(b) - before
+                    journal.undo()
+                elif action[0] != 'smash':
+                    assert delta == 0
+                assert b == copy
+
+
+def test_score_delta_perimeter_without_applying() -> None:
+    b = Block((0, 0), 750, None, 0, 1)
+    b.children = [Block((0, 0), 375, COLOUR_LIST[i], 1, 1) for i in range(4)]
+    hashed = b.board_hash()
+    g = PerimeterGoal(COLOUR_LIST[0])
+    assert g.score_delta(b, ('paint', None, b.children[1])) == 2
+    assert g.score_delta(b, ('swap', 0, b)) == 0
+    assert g.score_delta(b, ('combine', None, b)) == 0
+    assert b.board_hash() == hashed
+
+
+def test_score_delta_on_rebuilt_board_skips_scoring(monkeypatch) -> None:
+    b = Block((0, 0), 750, None, 0, 1)
+    b.children = [Block((0, 0), 375, COLOUR_LIST[i], 1, 1) for i in range(4)]
+    g = PerimeterGoal(COLOUR_LIST[0])
+    for rebuilt in (PersistentBlock.from_block(b).to_block(),
+                    BoardArena.from_block(b).to_block()):
+        assert rebuilt.children[1].border_edges() == [0, 3]
+        assert rebuilt.children[1].path() == [1]
+        monkeypatch.setattr(g, 'score', None)
+        assert g.score_delta(rebuilt,
+                             ('paint', None, rebuilt.children[1])) == 2
+        monkeypatch.undo()
+
+
+# === LEGAL MOVES ===
+
+
+def test_legal_moves_are_valid_and_distinct() -> None:
+    random.seed(19)
+    b = generate_board(3, 750)
+    g = BlobGoal(COLOUR_LIST[2])
+    moves = list(legal_moves(b, g))
+    assert len({(m[0], m[1], id(m[2])) for m in moves}) == len(moves)
+    for move in moves:
+        journal = MoveJournal()
+        assert journal.apply(move, g.colour)
+        journal.undo()
+
+
+def test_legal_moves_skip_symmetric_blocks() -> None:
+    b = Block((0, 0), 750, None, 0, 1)
+    b.children = [Block((0, 0), 375, COLOUR_LIST[i % 2], 1, 1)
+                  for i in range(4)]
+    moves = LegalMoves(b, PerimeterGoal(COLOUR_LIST[0]))
+    # Turning the checkerboard once is the same as turning it back, and
+    # neither swap leaves it as it is. Two cells can be painted.
+    assert sorted(m[0] for m in moves._moves) == \
+        ['paint', 'paint', 'rotate', 'swap', 'swap']
+    assert moves.sample() in moves._moves
+
+
+def test_combine_majority_agrees_across_engines() -> None:
+    for picks in ([0, 0, 0, 1], [0, 0, 1, 1], [0, 0, 1, 2], [0, 1, 2, 3]):
+        b = Block((0, 0), 750, None, 0, 1)
+        b.children = [Block((0, 0), 375, COLOUR_LIST[i], 1, 1)
+                      for i in picks]
+        winner = b.combine_colour()
+        combined = PersistentBlock.from_block(b).combined()
+        arena = BoardArena.from_block(b)
+        assert arena.combine(0) == (winner is not None)
+        if winner is None:
+            assert combined is None
+            assert not b.combine()
+        else:
+            assert winner == colour_index(COLOUR_LIST[0])
+            assert combined.colour_index == winner
+            assert arena.colour(0) == COLOUR_LIST[0]
+            assert b.combine() and b.colour_index == winner
+
+
+# === MOVE INDEX ===
+
+
+def test_move_index_follows_moves() -> None:
+    random.seed(20)
+    b = generate_board(3, 750)
+    g = BlobGoal(COLOUR_LIST[0])
+    index = MoveIndex(b, g)
+    journal = MoveJournal()
+    for _ in range(20):
+        move = index.sample()
+        assert journal.apply(move, g.colour) or move[0] == 'smash'
+        index.sample()
+        assert len(index) == len(MoveIndex(b, g))
+
+
+def test_move_index_forgets_combined_children() -> None:
+    b = Block((0, 0), 750, None, 0, 1)
+    b.children = [Block((0, 0), 375, COLOUR_LIST[0], 1, 1) for _ in range(4)]
+    index = MoveIndex(b, PerimeterGoal(COLOUR_LIST[1]))
+    # Four rotations and swaps, one combine and four paints.
+    assert len(index) == 9
+    b.combine()
+    assert index.sample() == ('smash', None, b)
+    assert len(index) == 1
+
+
+def test_random_player_passes_without_valid_moves() -> None:
+    b = Block((0, 0), 750, COLOUR_LIST[0], 0, 0)
+    player = RandomPlayer(0, BlobGoal(COLOUR_LIST[0]))
+    player._proceed = True
+    assert player.generate_move(b) == ('pass', None, b)
+
+
+# === PARALLEL SMART PLAYER ===
+
+
+def test_parallel_smart_player_does_not_mutate() -> None:
+    b = generate_board(3, 750)
+    copy = b.create_copy()
+    player = SmartPlayer(0, BlobGoal(COLOUR_LIST[0]), 20, workers=2)
+    player._proceed = True
+    try:
+        move = player.generate_move(b)
+    finally:
+        player.close()
+    assert b == copy
+    assert move[0] in ['swap', 'rotate', 'paint', 'combine', 'smash', 'pass']
+    if move[0] != 'pass':
+        assert _get_block(b, move[2].position, move[2].level) is move[2]
+
+
+def test_parallel_smart_player_is_reproducible() -> None:
+    # Every valid candidate is a turn or swap of the board, which leaves the
+    # blob score as it is, or a smash of one of its four leaves, whose result
+    # is random.
+    b = Block((0, 0), 750, None, 0, 3)
+    b.children = [Block(b._children_positions()[i], 375, COLOUR_LIST[i], 1, 3)
+                  for i in range(4)]
+    player = SmartPlayer(0, BlobGoal(COLOUR_LIST[0]), 60, workers=2)
+    moves = []
+    try:
+        for _ in range(4):
+            random.seed(148)
+            player._proceed = True
+            action, direction, block = player.generate_move(b)
+            moves.append((action, direction, block.position, block.level))
+    finally:
+        player.close()
+    assert moves == [moves[0]] * 4
+
+
+def test_smash_with_generator_is_reproducible() -> None:
+    # The random module is left in a different state for each smash.
+    boards = [Block((0, 0), 750, COLOUR_LIST[0], 0, 4) for _ in range(2)]
+    for i in range(2):
+        random.seed(i)
+        assert boards[i].smash(random.Random(21))
+    assert boards[0] == boards[1]
+
+
+def test_game_over_stops_worker_processes() -> None:
+    b = generate_board(2, 750)
+    player = SmartPlayer(1, BlobGoal(COLOUR_LIST[0]), 4, workers=2)
+    player._proceed = True
+    player.generate_move(b)
+    assert player._pool is not None
+    GameOverState(GameData(b, [RandomPlayer(0, BlobGoal(COLOUR_LIST[1])),
+                               player]))
+    assert player._pool is None
+
+
+# === TIME BUDGET ===
+
+
+def test_time_limited_smart_player_counts_moves(monkeypatch) -> None:
+    # A clock that moves on by a millisecond each time it is read, so the
+    # budget lasts for 20 reads however fast the machine is.
+    reads = []
+
+    def clock() -> float:
+        reads.append(None)
+        return len(reads) / 1000
+
+    monkeypatch.setattr(time, 'perf_counter', clock)
+    b = generate_board(4, 750)
+    copy = b.create_copy()
+    player = SmartPlayer(0, BlobGoal(COLOUR_LIST[0]), 1, time_limit=0.0205)
+    player._proceed = True
+    move = player.generate_move(b)
+    assert b == copy
+    assert move[0] in ['swap', 'rotate', 'paint', 'combine', 'smash', 'pass']
+    assert 1 < player.evaluated <= 21
+    assert len(reads) <= 22
+
+
+def test_time_limited_smart_player_tries_one_move() -> None:
+    b = generate_board(3, 750)
+    player = SmartPlayer(0, PerimeterGoal(COLOUR_LIST[2]), 50, time_limit=0)
+    player._proceed = True
+    player.generate_move(b)
+    assert player.evaluated == 1
+    player = SmartPlayer(0, PerimeterGoal(COLOUR_LIST[2]), 50)
+    player._proceed = True
+    player.generate_move(b)
+    assert player.evaluated == 50
+
+
+# === MCTS PLAYER ===
+
+
+def test_mcts_player_does_not_mutate() -> None:
+    b = generate_board(3, 750)
+    copy = b.create_copy()
+    player = MCTSPlayer(0, BlobGoal(COLOUR_LIST[0]), 50)
+    player._proceed = True
+    move = player.generate_move(b)
+    assert b == copy
+    assert move[0] in ['swap', 'rotate', 'paint', 'combine', 'smash', 'pass']
+    if move[0] != 'pass':
+        assert _get_block(b, move[2].position, move[2].level) is move[2]
+
+
+def test_mcts_player_reuses_tree() -> None:
+    b = generate_board(3, 750)
+    goal = PerimeterGoal(COLOUR_LIST[1])
+    player = MCTSPlayer(0, goal, 40)
+    player._proceed = True
+    move = player.generate_move(b)
+    for _ in range(4):
+        kept = player._root
+        visits = kept.visits
+        MoveJournal().apply(move, goal.colour)
+        player._proceed = True
+        next_move = player.generate_move(b)
+        if move[0] != 'smash':
+            assert kept.visits == visits + 40
+        move = next_move
+
+
+def test_mcts_player_reuses_tree_after_opponent_moves() -> None:
+    random.seed(23)
+    b = generate_board(1, 750)
+    goal = PerimeterGoal(COLOUR_LIST[1])
+    player = MCTSPlayer(0, goal, 100)
+    player._proceed = True
+    move = player.generate_move(b)
+    MoveJournal().apply(move, goal.colour)
+    # An opponent makes one of the moves the player had already looked at.
+    reply, node = next((m, n) for m, n in player._root.children.items()
+                       if m[1] not in (SMASH, PAINT))
+    path, action = reply
+    MoveJournal().apply(_create_move(action, _block_at_path(b, list(path))),
+                        COLOUR_LIST[2])
+    visits = node.visits
+    player._proceed = True
+    player.generate_move(b)
+    assert node.visits == visits + 100
+
+
+# === ALPHA-BETA PLAYER ===
+
+
+def test_alpha_beta_player_does_not_mutate() -> None:
+    b = generate_board(3, 750)
+    copy = b.create_copy()
+    goals = [BlobGoal(COLOUR_LIST[0]), PerimeterGoal(COLOUR_LIST[1])]
+    player = AlphaBetaPlayer(0, goals[0], goals[1:], plies=3)
+    player._proceed = True
+    move = player.generate_move(b)
+    assert b == copy
+    assert move[0] in ['swap', 'rotate', 'paint', 'combine', 'pass']
+    if move[0] != 'pass':
+        assert _get_block(b, move[2].position, move[2].level) is move[2]
+
+
+def test_alpha_beta_player_improves_and_reuses_table() -> None:
+    b = Block((0, 0), 750, None, 0, 1)
+    b.children = [Block(b._children_positions()[i], 375, COLOUR_LIST[c], 1, 1)
+                  for i, c in enumerate([0, 0, 0, 1])]
+    goal = PerimeterGoal(COLOUR_LIST[0])
+    player = AlphaBetaPlayer(0, goal, [PerimeterGoal(COLOUR_LIST[1])],
+                             plies=2)
+    player._proceed = True
+    move = player.generate_move(b)
+    # Painting the last child and combining the board both score 8 - 1.
+    assert move in [('paint', None, b.children[3]), ('combine', None, b)]
+    size = len(player._table)
+    player._proceed = True
+    assert player.generate_move(b) == move
+    assert len(player._table) == size
+
+
+def test_alpha_beta_root_search_keeps_moves_it_could_not_make() -> None:
+    b = Block((0, 0), 750, None, 0, 1)
+    b.children = [Block(b._children_positions()[i], 375, COLOUR_LIST[c], 1, 1)
+                  for i, c in enumerate([0, 0, 0, 1])]
+    goal = PerimeterGoal(COLOUR_LIST[0])
+    player = AlphaBetaPlayer(0, goal, [PerimeterGoal(COLOUR_LIST[1])])
+    entry = player._scan(b, 0)[0]
+    # The children are at the deepest level, so none of them can be smashed.
+    stuck = ((0,), SMASH)
+    entry.moves.insert(0, stuck)
+    player._deadline = time.perf_counter() + 60
+    assert player._root_search(b, 2) is not None
+    assert entry.moves[-1] == stuck
+
+
+def test_create_players_alpha_beta_opponents() -> None:
+    players = create_players(1, 0, [2], 2)
+    assert [type(p) for p in players] == \
+        [HumanPlayer, SmartPlayer, AlphaBetaPlayer, AlphaBetaPlayer]
+    goals = [p.goal for p in players]
+    assert players[2]._goals == goals[2:] + goals[:2]
+    assert players[3]._goals == goals[3:] + goals[:3]
+
+
+# === CANONICAL HASH ===
+
+
+def _mirror(block: Block) -> None:
+    """Mirror <block> left to right in place."""
+    if block.children:
+        block.swap(0)
+        for child in block.children:
+            _mirror(child)
+
+
+def test_board_hash_of_mirror_image() -> None:
+    b = generate_board(4, 750)
+    b.children[1].rotate(1)
+    hashes = [b.board_hash(turns, True) for turns in range(4)]
+    copy = b.create_copy()
+    _mirror(copy)
+    for turns in range(4):
+        assert copy.board_hash() == hashes[turns]
+        copy.rotate(1)
+    assert copy.canonical_hash() == b.canonical_hash()
+    assert b.board_hash(*b.canonical_symmetry()) == b.canonical_hash()
+
+
+def test_score_cache_shared_by_symmetric_boards(monkeypatch) -> None:
+    monkeypatch.setattr(goal, 'SCORE_CACHE', goal.ScoreCache(16))
+    b = generate_board(3, 750)
+    blob = BlobGoal(COLOUR_LIST[0])
+    score = blob.score(b)
+    copy = b.create_copy()
+    _mirror(copy)
+    copy.rotate(3)
+    assert blob.score(copy) == score
+    assert (goal.SCORE_CACHE.hits, goal.SCORE_CACHE.misses) == (1, 1)
+
+
+def test_alpha_beta_table_shared_by_symmetric_boards() -> None:
+    b = generate_board(3, 750)
+    goals = [PerimeterGoal(COLOUR_LIST[0]), BlobGoal(COLOUR_LIST[1])]
+    player = AlphaBetaPlayer(0, goals[0], goals[1:], plies=2)
+    player._proceed = True
+    player.generate_move(b)
+    size = len(player._table)
+    copy = b.create_copy()
+    _mirror(copy)
+    copy.rotate(1)
+    player._proceed = True
+    action, direction, block = player.generate_move(copy)
+    assert len(player._table) == size
+    if action != 'pass':
+        assert _get_block(copy, block.position, block.level) is block
+
+
 if __name__ == '__main__':
     pytest.main(['testsa2.py'])